@@ -0,0 +1,260 @@
+"""Search benchmarks on a fixed set of positions.
+
+Runs the game's search (iterative deepening up to each difficulty depth,
+with and without alpha-beta) on curated opening, midgame and near-forced-win
+positions and records nodes, wall time, nodes per second and peak memory:
+
+    python benchmark.py --save baseline.json
+    python benchmark.py --compare baseline.json --threshold 0.2
+
+--compare exits with status 1 when any case loses more than --threshold of
+its baseline nodes per second. Every case is timed --repeat times and the
+fastest run counts. Cases shorter than MIN_COMPARE_SECONDS are reported but
+never fail, they are too short to time reliably. --threats runs the
+searches with threat pruning and reports the moves each shortcut skipped. Positions are written as
+the columns played (1-7) from the empty board, first player first.
+--variants also runs every other board geometry given, such as 9x10x5,
+on an empty board and on openings of fixed random moves, so a change to
+the generic code can be timed next to the standard board.
+--startup times fresh interpreters instead, one that imports the engine
+and one that also plays a first move, and exits with status 1 when they
+take more than --startup-target seconds longer than a bare interpreter or
+load NumPy or pygame. Worker processes are started all the time, so for
+small jobs their startup matters more than the search.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from bitboard import STANDARD, Position, parse_variant
+from evaluation import AI_PLAYER, HUMAN_PLAYER
+from search import iterative_deepening
+
+POSITIONS = {
+    "opening-empty": "",
+    "opening-4453": "4453",
+    "midgame-44444322": "44444322",
+    "midgame-3445322567": "3445322567",
+    "forced-win-322611344211": "322611344211",
+    "forced-win-2665264451411115": "2665264451411115",
+}
+
+DEPTHS = (2, 4, 6, 8)
+# Plain minimax visits every node, depth 8 would take minutes per position
+MAX_MINIMAX_DEPTH = 6
+MIN_COMPARE_SECONDS = 0.05
+
+VARIANTS = ("5x6x3", "7x8x5", "9x10x4", "9x10x5", "9x10x6")
+# Plies of random opening for the variant positions, and the seed that fixes them
+VARIANT_PLIES = (0, 8, 16)
+VARIANT_SEED = 0
+
+# Scripts timed in a fresh interpreter by --startup, python is the baseline
+STARTUP_SCRIPTS = {
+    "python": "pass",
+    "import-engine": "import engine",
+    "first-move": "import engine; engine.iterative_deepening(engine.Position.from_moves('4453'), False, max_depth=4, "
+                  "use_alpha_beta=True)",
+}
+# Seconds the engine may add to a bare interpreter start
+STARTUP_TARGET = 0.1
+# Modules the engine must not load up front
+HEAVY_MODULES = ("numpy", "pygame")
+
+
+def position_from_moves(moves, geometry=STANDARD):
+    return geometry.position_class.from_moves(moves)
+
+
+def _quiet(position, col, piece):
+    # The move neither wins nor leaves the opponent a win on the next move
+    geometry = position.geometry
+    position.play(col, piece)
+    mask = position.mask()
+    quiet = not position.is_win(piece) and not (
+        geometry.winning_cells(position.bitboards[AI_PLAYER + HUMAN_PLAYER - piece], mask)
+        & geometry.playable_cells(mask))
+    position.undo()
+    return quiet
+
+
+def variant_positions(geometry, plies=VARIANT_PLIES, seed=VARIANT_SEED):
+    # Openings of random quiet moves, as lists of columns (1 and up), so the
+    # search has work to do at every depth
+    rng = random.Random(seed)
+    positions = {}
+    for count in plies:
+        moves = None
+        while moves is None:
+            # Start over when a side runs out of quiet moves
+            position = geometry.position_class()
+            moves = []
+            for ply in range(count):
+                piece = HUMAN_PLAYER if ply % 2 == 0 else AI_PLAYER
+                candidates = [col for col in position.valid_moves() if _quiet(position, col, piece)]
+                if not candidates:
+                    moves = None
+                    break
+                col = rng.choice(candidates)
+                position.play(col, piece)
+                moves.append(col + 1)
+        positions["empty" if not count else f"random-{count}"] = moves
+    return positions
+
+
+def run_case(moves, depth, use_alpha_beta, measure_memory=True, repeat=3, use_threats=False, geometry=STANDARD):
+    board = position_from_moves(moves, geometry).to_array()
+    maximizing = len(moves) % 2 == 1  # AI_PLAYER moves second
+    seconds = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        _, _, info = iterative_deepening(board, maximizing, max_depth=depth, use_alpha_beta=use_alpha_beta,
+                                         use_threats=use_threats, geometry=geometry)
+        elapsed = time.perf_counter() - start_time
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+
+    result = {
+        "nodes": info["nodes"],
+        "seconds": round(seconds, 6),
+        "nodes_per_sec": round(info["nodes"] / seconds, 1) if seconds else 0.0,
+        "depth": info["depth"],
+    }
+    if use_threats:
+        result["pruned"] = info["pruned"]
+    if measure_memory:
+        # A second run, tracemalloc slows the search down too much to time it
+        tracemalloc.start()
+        iterative_deepening(board, maximizing, max_depth=depth, use_alpha_beta=use_alpha_beta, use_threats=use_threats,
+                            geometry=geometry)
+        result["peak_kib"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        tracemalloc.stop()
+    return result
+
+
+def run_suite(depths=DEPTHS, max_minimax_depth=MAX_MINIMAX_DEPTH, measure_memory=True, repeat=3,
+              positions=POSITIONS, use_threats=False, geometry=STANDARD):
+    # Cases on other geometries are named after the variant, standard ones keep their names
+    prefix = "" if geometry == STANDARD else "{}x{}x{}/".format(*geometry.shape())
+    results = {}
+    for name, moves in positions.items():
+        for depth in depths:
+            for use_alpha_beta in (False, True):
+                if not use_alpha_beta and depth > max_minimax_depth:
+                    continue
+                case = f"{prefix}{name}/{'alphabeta' if use_alpha_beta else 'minimax'}/d{depth}"
+                results[case] = run_case(moves, depth, use_alpha_beta, measure_memory, repeat, use_threats,
+                                         geometry)
+    return results
+
+
+def startup_times(repeat=5):
+    # Fastest start of every startup script and the heavy modules it loaded
+    check = "; import sys; print(' '.join(name for name in {!r} if name in sys.modules))".format(HEAVY_MODULES)
+    results = {}
+    for name, script in STARTUP_SCRIPTS.items():
+        seconds = None
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            output = subprocess.run([sys.executable, "-c", script + check], capture_output=True, text=True, check=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+            elapsed = time.perf_counter() - start_time
+            seconds = elapsed if seconds is None else min(seconds, elapsed)
+        results[name] = {"seconds": round(seconds, 6), "loaded": output.split()}
+    return results
+
+
+def check_startup(results, target):
+    failures = []
+    base = results["python"]["seconds"]
+    for name, result in results.items():
+        overhead = result["seconds"] - base
+        status = "-" if name == "python" else "FAIL" if overhead > target or result["loaded"] else "ok"
+        if status == "FAIL":
+            failures.append(name)
+        print(f"{status:4} {name:20} {result['seconds'] * 1000:8.1f} ms ({overhead * 1000:+.1f} ms)"
+              + (" loaded " + ", ".join(result["loaded"]) if result["loaded"] else ""))
+    return failures
+
+
+def compare(results, baseline, threshold):
+    failures = []
+    for case, base in sorted(baseline["results"].items()):
+        if case not in results:
+            continue
+        current = results[case]
+        change = current["nodes_per_sec"] / base["nodes_per_sec"] - 1 if base["nodes_per_sec"] else 0.0
+        if base["seconds"] < MIN_COMPARE_SECONDS:
+            status = "-"
+        else:
+            status = "FAIL" if change < -threshold else "ok"
+        if status == "FAIL":
+            failures.append(case)
+        print(f"{status:4} {case:50} {base['nodes_per_sec']:>12.0f} -> {current['nodes_per_sec']:>12.0f} nodes/s "
+              f"({change:+.1%}), nodes {base['nodes']} -> {current['nodes']}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the minimax search on fixed positions.")
+    parser.add_argument("--depths", default=",".join(map(str, DEPTHS)))
+    parser.add_argument("--max-minimax-depth", type=int, default=MAX_MINIMAX_DEPTH)
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory runs")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case, the fastest counts")
+    parser.add_argument("--threats", action="store_true", help="search with threat pruning")
+    parser.add_argument("--variants", nargs="?", const=",".join(VARIANTS), default="",
+                        help="also benchmark these geometries (default: " + ",".join(VARIANTS) + ")")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed drop in nodes/sec before a case fails (default 0.2 = 20%%)")
+    parser.add_argument("--startup", action="store_true", help="only time the engine startup in fresh interpreters")
+    parser.add_argument("--startup-target", type=float, default=STARTUP_TARGET,
+                        help=f"seconds the engine may add to the interpreter start (default {STARTUP_TARGET})")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        failures = check_startup(startup_times(args.repeat), args.startup_target)
+        if failures:
+            print(f"{len(failures)} startup(s) over the {args.startup_target * 1000:.0f} ms target or loading "
+                  + "/".join(HEAVY_MODULES))
+            sys.exit(1)
+        return
+
+    depths = [int(depth) for depth in args.depths.split(",")]
+    results = run_suite(depths, args.max_minimax_depth, not args.no_memory, args.repeat, use_threats=args.threats)
+    for variant in filter(None, args.variants.split(",")):
+        geometry = parse_variant(variant)
+        results.update(run_suite(depths, args.max_minimax_depth, not args.no_memory, args.repeat,
+                                 variant_positions(geometry), args.threats, geometry))
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        failures = compare(results, baseline, args.threshold)
+        if failures:
+            print(f"{len(failures)} case(s) slower than the baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
+    else:
+        for case, result in results.items():
+            print(f"{case:50} {result['nodes']:>9} nodes {result['seconds']:>9.3f}s "
+                  f"{result['nodes_per_sec']:>10.0f} nodes/s {result.get('peak_kib', 0):>9.1f} KiB")
+            if "pruned" in result:
+                print(" " * 51 + ", ".join(f"{name} {count}" for name, count in result["pruned"].items()))
+
+
+if __name__ == "__main__":
+    main()
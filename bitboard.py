@@ -0,0 +1,405 @@
+"""Bitboard representation of a Connect Four position.
+
+Each player's discs live in one integer mask. The board is stored column by
+column, bottom-up, with one spare bit on top of every column (7 bits per
+column on the standard 6x7 board), so four-in-a-row can be found with a few
+shifts and the next open cell of a column is a single entry in a height table.
+
+The module-level tables and functions are written out for the standard 6x7
+board and four in a row. Geometry builds the same tables and shift patterns
+for other board sizes and connect-N, and Geometry.position_class is a
+Position for that board. Bitboards are Python integers, so boards of more
+than 64 bits (9x10 takes 100) work the same way, only the NumPy conversion
+tables fall back from int64 to Python integers there. NumPy is only imported
+by the array board adapters, code that sticks to bitboards never loads it.
+
+The board is symmetric under left-right reflection, so a position and its
+mirror image have the same value with the columns mirrored. canonical_key()
+gives both the same key, for tables that should store only one of them.
+"""
+import functools
+
+ROW_COUNT = 6
+COLUMN_COUNT = 7
+H1 = ROW_COUNT + 1  # column height including the spare bit
+
+BOTTOM_MASK = sum(1 << (c * H1) for c in range(COLUMN_COUNT))
+BOARD_MASK = BOTTOM_MASK * ((1 << ROW_COUNT) - 1)
+
+# Bit index of the bottom cell and of the spare cell above each column
+_COLUMN_BASE = [c * H1 for c in range(COLUMN_COUNT)]
+_COLUMN_TOP = [c * H1 + ROW_COUNT for c in range(COLUMN_COUNT)]
+COLUMN_MASKS = [((1 << ROW_COUNT) - 1) << (c * H1) for c in range(COLUMN_COUNT)]
+# Every column with its spare bit, for mirroring
+_C0, _C1, _C2, _C3, _C4, _C5, _C6 = (((1 << H1) - 1) << (c * H1) for c in range(COLUMN_COUNT))
+
+
+@functools.lru_cache(maxsize=None)
+def _cell_weights():
+    # Weight of every board[r][c] cell in the bitboard, used by the array adapter
+    import numpy as np
+    return np.array([[1 << (c * H1 + r) for c in range(COLUMN_COUNT)] for r in range(ROW_COUNT)], dtype=np.int64)
+
+
+def has_four(bb):
+    # Vertical
+    m = bb & (bb >> 1)
+    if m & (m >> 2):
+        return True
+    # Horizontal
+    m = bb & (bb >> H1)
+    if m & (m >> 2 * H1):
+        return True
+    # Positively sloped diagonal
+    m = bb & (bb >> (H1 + 1))
+    if m & (m >> 2 * (H1 + 1)):
+        return True
+    # Negatively sloped diagonal
+    m = bb & (bb >> (H1 - 1))
+    if m & (m >> 2 * (H1 - 1)):
+        return True
+    return False
+
+
+def winning_cells(stones, mask):
+    # Threat mask: the empty cells that would complete four in a row for stones
+    # Vertical
+    r = (stones << 1) & (stones << 2) & (stones << 3)
+    # Horizontal and both diagonals
+    for shift in (H1, H1 - 1, H1 + 1):
+        p = (stones << shift) & (stones << 2 * shift)
+        r |= p & (stones << 3 * shift)
+        r |= p & (stones >> shift)
+        p = (stones >> shift) & (stones >> 2 * shift)
+        r |= p & (stones << shift)
+        r |= p & (stones >> 3 * shift)
+    return r & (BOARD_MASK ^ mask)
+
+
+def playable_cells(mask):
+    # The next open cell of every column that is not full
+    return (mask + BOTTOM_MASK) & BOARD_MASK
+
+
+def column_of(cell_mask):
+    # Column of the highest set cell
+    return (cell_mask.bit_length() - 1) // H1
+
+
+def bitboard_from_array(board, piece):
+    import numpy as np
+    return int((np.asarray(board) == piece).astype(np.int64).ravel() @ _cell_weights().ravel())
+
+
+def mirror(bb):
+    # bb reflected left to right, spare bits included, so it also mirrors position keys
+    return (bb & _C3 | (bb & _C0) << 42 | (bb & _C6) >> 42 | (bb & _C1) << 28 | (bb & _C5) >> 28
+            | (bb & _C2) << 14 | (bb & _C4) >> 14)
+
+
+def mirror_moves(moves, columns=COLUMN_COUNT):
+    # A move string (columns 1-9) of the mirror image game
+    return "".join(str(columns + 1 - int(move)) for move in moves)
+
+
+def _shifted(stones, shift):
+    # stones moved shift bits up, or down when shift is negative
+    return stones << shift if shift >= 0 else stones >> -shift
+
+
+class Geometry:
+    """Tables, shift patterns and win checks for a rows x columns board and connect in a row.
+
+    The standard 6x7 connect-4 geometry uses the hand-written module
+    functions, any other one the generic versions below.
+    """
+
+    def __init__(self, rows=ROW_COUNT, columns=COLUMN_COUNT, connect=4):
+        if rows < 1 or columns < 1 or connect < 2:
+            raise ValueError(f"Invalid geometry {rows}x{columns} connect {connect}")
+        self.rows = rows
+        self.columns = columns
+        self.connect = connect
+        self.h1 = h1 = rows + 1
+        self.cells = rows * columns
+        self.bottom_mask = sum(1 << (c * h1) for c in range(columns))
+        self.board_mask = self.bottom_mask * ((1 << rows) - 1)
+        self.column_base = [c * h1 for c in range(columns)]
+        self.column_top = [c * h1 + rows for c in range(columns)]
+        self.column_masks = [((1 << rows) - 1) << (c * h1) for c in range(columns)]
+        self.column_bottoms = [1 << (c * h1) for c in range(columns)]
+        # Line directions as bit shifts, only those with room for a line
+        self.shifts = [shift for shift, fits in ((1, rows >= connect), (h1, columns >= connect),
+                                                 (h1 + 1, min(rows, columns) >= connect),
+                                                 (h1 - 1, min(rows, columns) >= connect)) if fits]
+        if self.is_standard():
+            self.has_won = has_four
+            self.winning_cells = winning_cells
+            self.playable_cells = playable_cells
+            self.mirror = mirror
+
+    def __repr__(self):
+        return f"Geometry({self.rows}, {self.columns}, {self.connect})"
+
+    def __eq__(self, other):
+        return isinstance(other, Geometry) and self.shape() == other.shape()
+
+    def __hash__(self):
+        return hash(self.shape())
+
+    def shape(self):
+        # (rows, columns, connect), what geometry() needs to build it again. Worker
+        # processes get a Geometry as its shape, its generated classes do not pickle
+        return self.rows, self.columns, self.connect
+
+    def is_standard(self):
+        return self.shape() == (ROW_COUNT, COLUMN_COUNT, 4)
+
+    def has_won(self, bb):
+        for shift in self.shifts:
+            # Every doubling step keeps the cells that start twice as long a run
+            m, run = bb, 1
+            while run * 2 <= self.connect:
+                m &= m >> (run * shift)
+                run *= 2
+            if run < self.connect:
+                m &= m >> ((self.connect - run) * shift)
+            if m:
+                return True
+        return False
+
+    def winning_cells(self, stones, mask):
+        # The empty cells that complete connect in a row, wherever they are in the line
+        r = 0
+        for shift in self.shifts:
+            for gap in range(self.connect):
+                m = -1
+                for i in range(self.connect):
+                    if i != gap:
+                        m &= _shifted(stones, (gap - i) * shift)
+                r |= m
+        return r & (self.board_mask ^ mask)
+
+    def playable_cells(self, mask):
+        return (mask + self.bottom_mask) & self.board_mask
+
+    def column_of(self, cell_mask):
+        return (cell_mask.bit_length() - 1) // self.h1
+
+    def mirror(self, bb):
+        column_bits, h1, last = (1 << self.h1) - 1, self.h1, self.columns - 1
+        r = 0
+        for c in range(self.columns):
+            r |= (bb >> (c * h1) & column_bits) << ((last - c) * h1)
+        return r
+
+    @functools.cached_property
+    def cell_weights(self):
+        # int64 weights while every bit fits, Python integers beyond that
+        import numpy as np
+        rows, columns, h1 = self.rows, self.columns, self.h1
+        dtype = np.int64 if columns * h1 <= 63 else object
+        return np.array([[1 << (c * h1 + r) for c in range(columns)] for r in range(rows)], dtype=dtype).ravel()
+
+    def bitboard_from_array(self, board, piece):
+        import numpy as np
+        return int((np.asarray(board) == piece).astype(np.int64).ravel() @ self.cell_weights)
+
+    @functools.cached_property
+    def position_class(self):
+        if self.is_standard():
+            return Position
+        return type(f"Position{self.rows}x{self.columns}x{self.connect}", (GeometryPosition,),
+                    {"__slots__": (), "geometry": self})
+
+
+class Position:
+    """Two player masks plus a per-column height table.
+
+    Pieces use the same values as the array board (HUMAN_PLAYER = 1,
+    AI_PLAYER = 2), so ``bitboards[piece]`` is that player's mask and index 0
+    is unused.
+    """
+
+    __slots__ = ("bitboards", "heights", "moves")
+
+    def __init__(self):
+        self.bitboards = [0, 0, 0]
+        self.heights = list(_COLUMN_BASE)  # bit index of the next free cell
+        self.moves = []
+
+    @classmethod
+    def from_array(cls, board):
+        import numpy as np
+        position = cls()
+        board = np.asarray(board)
+        position.bitboards[1] = bitboard_from_array(board, 1)
+        position.bitboards[2] = bitboard_from_array(board, 2)
+        filled = np.count_nonzero(board, axis=0)
+        position.heights = [_COLUMN_BASE[c] + int(filled[c]) for c in range(COLUMN_COUNT)]
+        return position
+
+    @classmethod
+    def from_moves(cls, moves):
+        # moves are the columns played (1-7) from the empty board, player 1 first
+        position = cls()
+        for ply, move in enumerate(moves):
+            col = int(move) - 1
+            if not 0 <= col < len(position.heights) or not position.can_play(col):
+                raise ValueError(f"Illegal move {move!r} at ply {ply + 1}")
+            position.play(col, 1 if ply % 2 == 0 else 2)
+        return position
+
+    @classmethod
+    def from_position(cls, other):
+        # other as an instance of cls, same stones and moves, no array board in between
+        position = cls()
+        position.bitboards = list(other.bitboards)
+        position.heights = list(other.heights)
+        position.moves = list(other.moves)
+        return position
+
+    def to_array(self):
+        import numpy as np
+        board = np.zeros((ROW_COUNT, COLUMN_COUNT))
+        for piece in (1, 2):
+            bb = self.bitboards[piece]
+            board[(bb & _cell_weights()) != 0] = piece
+        return board
+
+    def copy(self):
+        position = type(self)()
+        position.bitboards = list(self.bitboards)
+        position.heights = list(self.heights)
+        position.moves = list(self.moves)
+        return position
+
+    def mask(self):
+        return self.bitboards[1] | self.bitboards[2]
+
+    def can_play(self, col):
+        return self.heights[col] < _COLUMN_TOP[col]
+
+    def next_open_row(self, col):
+        return self.heights[col] - _COLUMN_BASE[col]
+
+    def valid_moves(self):
+        heights = self.heights
+        return [c for c in range(COLUMN_COUNT) if heights[c] < _COLUMN_TOP[c]]
+
+    def play(self, col, piece):
+        self.bitboards[piece] |= 1 << self.heights[col]
+        self.heights[col] += 1
+        self.moves.append((col, piece))
+
+    def undo(self):
+        col, piece = self.moves.pop()
+        self.heights[col] -= 1
+        self.bitboards[piece] ^= 1 << self.heights[col]
+        return col
+
+    def is_win(self, piece):
+        return has_four(self.bitboards[piece])
+
+    def is_full(self):
+        return self.mask() == BOARD_MASK
+
+    def key(self):
+        # The filled-cell mask plus the bottom row marks every column height,
+        # so adding one player's discs gives a unique key for the position.
+        return self.bitboards[1] + self.mask() + BOTTOM_MASK
+
+    def canonical_key(self):
+        # The smaller of key() and the key of the mirror image, and whether it is
+        # the mirror's: a column stored under the key is then mirrored as well
+        key = self.key()
+        mirrored = self.geometry.mirror(key)
+        return (mirrored, True) if mirrored < key else (key, False)
+
+    def is_symmetric(self):
+        key = self.key()
+        return self.geometry.mirror(key) == key
+
+    def mirrored(self):
+        # A new position, the mirror image of this one, moves included
+        geometry = self.geometry
+        last = geometry.columns - 1
+        base = geometry.column_base
+        position = type(self)()
+        position.bitboards = [geometry.mirror(bb) for bb in self.bitboards]
+        position.heights = [base[c] + self.heights[last - c] - base[last - c] for c in range(geometry.columns)]
+        position.moves = [(last - col, piece) for col, piece in self.moves]
+        return position
+
+
+class GeometryPosition(Position):
+    """Position on the board of a Geometry, see Geometry.position_class."""
+
+    __slots__ = ()
+    geometry = None
+
+    def __init__(self):
+        self.bitboards = [0, 0, 0]
+        self.heights = list(self.geometry.column_base)
+        self.moves = []
+
+    @classmethod
+    def from_array(cls, board):
+        import numpy as np
+        geometry = cls.geometry
+        position = cls()
+        board = np.asarray(board)
+        position.bitboards[1] = geometry.bitboard_from_array(board, 1)
+        position.bitboards[2] = geometry.bitboard_from_array(board, 2)
+        filled = np.count_nonzero(board, axis=0)
+        position.heights = [geometry.column_base[c] + int(filled[c]) for c in range(geometry.columns)]
+        return position
+
+    def to_array(self):
+        import numpy as np
+        geometry = self.geometry
+        board = np.zeros((geometry.rows, geometry.columns))
+        for piece in (1, 2):
+            bb = self.bitboards[piece]
+            for r in range(geometry.rows):
+                for c in range(geometry.columns):
+                    if bb >> (c * geometry.h1 + r) & 1:
+                        board[r][c] = piece
+        return board
+
+    def can_play(self, col):
+        return self.heights[col] < self.geometry.column_top[col]
+
+    def next_open_row(self, col):
+        return self.heights[col] - self.geometry.column_base[col]
+
+    def valid_moves(self):
+        heights, top = self.heights, self.geometry.column_top
+        return [c for c in range(len(top)) if heights[c] < top[c]]
+
+    def is_win(self, piece):
+        return self.geometry.has_won(self.bitboards[piece])
+
+    def is_full(self):
+        return self.mask() == self.geometry.board_mask
+
+    def key(self):
+        return self.bitboards[1] + self.mask() + self.geometry.bottom_mask
+
+
+STANDARD = Geometry()
+Position.geometry = STANDARD
+
+
+@functools.lru_cache(maxsize=None)
+def geometry(rows=ROW_COUNT, columns=COLUMN_COUNT, connect=4):
+    # One shared Geometry, with its tables and classes, per board
+    return STANDARD if (rows, columns, connect) == STANDARD.shape() else Geometry(rows, columns, connect)
+
+
+def parse_variant(spec):
+    # "9x10x5" is a 9 row, 10 column board with five in a row, "6x7" keeps four
+    parts = [int(part) for part in spec.lower().split("x")]
+    if len(parts) not in (2, 3):
+        raise ValueError(f"A variant is ROWSxCOLUMNS or ROWSxCOLUMNSxCONNECT, not {spec!r}")
+    return geometry(*parts)
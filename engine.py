@@ -0,0 +1,86 @@
+"""The Connect Four engine as one importable module, without pygame.
+
+Batch jobs, worker processes and the server only need the rules and the
+search, not the game window, so everything the AI does is reachable from
+here: the board rules the game has always used (create_board, drop_piece,
+winning_move, get_valid_locations...), evaluation and search. "final code.py"
+is a frontend on top of this module.
+
+Importing it is cheap because nothing heavy is loaded up front. NumPy is
+imported by the first array board, and the solver, MCTS and opening book
+modules the first time one of their names is used. Code that works on
+bitboard positions never loads NumPy at all:
+
+    import engine
+    position = engine.Position.from_moves("4453")
+    column, score, info = engine.iterative_deepening(position, False, max_depth=6, use_alpha_beta=True)
+
+benchmark.py --startup times the import and a first move in a fresh
+interpreter against a target.
+"""
+import importlib
+
+from bitboard import STANDARD, Geometry, Position, parse_variant
+from evaluation import AI_PLAYER, HUMAN_PLAYER, EvaluatedPosition, evaluate_board
+from search import AI_WIN_SCORE, HUMAN_WIN_SCORE, SearchTimeout, iterative_deepening, minimax
+from transposition import TranspositionTable
+
+# Names from the modules only some users need, imported on first use
+_LAZY = {
+    "Solver": "solver",
+    "perfect_move": "solver",
+    "solve_batch": "solver",
+    "MCTS": "mcts",
+    "mcts_move": "mcts",
+    "OpeningBook": "opening_book",
+    "open_book": "opening_book",
+    "evaluate_batch": "evaluation",
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY[name]), name)
+    globals()[name] = value
+    return value
+
+
+def create_board(geometry=STANDARD):
+    import numpy as np
+    return np.zeros((geometry.rows, geometry.columns))
+
+
+def drop_piece(board, row, col, piece):
+    board[row][col] = piece
+
+
+def is_valid_location(board, col):
+    return board[len(board) - 1][col] == 0
+
+
+def get_next_open_row(board, col):
+    for r in range(len(board)):
+        if board[r][col] == 0:
+            return r
+
+
+def winning_move(board, piece, geometry=STANDARD):
+    return geometry.has_won(geometry.bitboard_from_array(board, piece))
+
+
+def score_position(board, piece, geometry=STANDARD):
+    return evaluate_board(board, piece, geometry)
+
+
+def is_terminal_node(board, geometry=STANDARD):
+    return winning_move(board, HUMAN_PLAYER, geometry) or winning_move(board, AI_PLAYER, geometry) \
+        or len(get_valid_locations(board)) == 0
+
+
+def get_valid_locations(board):
+    valid_locations = []
+    for col in range(len(board[0])):
+        if is_valid_location(board, col):
+            valid_locations.append(col)
+    return valid_locations
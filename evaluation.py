@@ -0,0 +1,290 @@
+"""Heuristic evaluation of Connect Four positions.
+
+Every group of four cells that can make a line (a window) is listed once in
+precomputed tables, both as board indices for NumPy and as bitboard masks.
+``evaluate_board`` scores a whole array board in one vectorized pass and
+``EvaluatedPosition`` keeps the score of a bitboard up to date move by move,
+rescoring only the windows that pass through the cell that changed, and
+``evaluate_batch`` scores and win-checks thousands of boards at once. All of
+them give exactly the same numbers as ``evaluate_window`` summed over the
+board plus the center column bonus.
+
+WindowTables builds the same tables for any Geometry, with windows as long
+as its connect, and evaluated_position_class gives the EvaluatedPosition
+for that board. The NumPy tables are built, and NumPy imported, the first
+time an array board is scored, the bitboard evaluation never needs them.
+"""
+import functools
+
+from bitboard import COLUMN_COUNT, H1, ROW_COUNT, STANDARD, Position
+
+HUMAN_PLAYER = 1
+AI_PLAYER = 2
+WINDOW_LENGTH = 4
+CENTER_WEIGHT = 3
+
+
+def evaluate_window(window, piece, length=WINDOW_LENGTH):
+    # length is the connect of the board, the scores are those of four in a row
+    score = 0
+    opp_piece = HUMAN_PLAYER if piece == AI_PLAYER else AI_PLAYER
+
+    if window.count(piece) == length:
+        score += 100
+    elif window.count(piece) == length - 1 and window.count(0) == 1:
+        score += 5
+    elif window.count(piece) == length - 2 and window.count(0) == 2:
+        score += 2
+
+    if window.count(opp_piece) == length - 1 and window.count(0) == 1:
+        score -= 4
+
+    return score
+
+
+def _build_windows(rows=ROW_COUNT, columns=COLUMN_COUNT, length=WINDOW_LENGTH):
+    windows = []
+    # Horizontal
+    for r in range(rows):
+        for c in range(columns - length + 1):
+            windows.append([(r, c + i) for i in range(length)])
+    # Vertical
+    for c in range(columns):
+        for r in range(rows - length + 1):
+            windows.append([(r + i, c) for i in range(length)])
+    # Positive sloped diagonal
+    for r in range(rows - length + 1):
+        for c in range(columns - length + 1):
+            windows.append([(r + i, c + i) for i in range(length)])
+    # Negative sloped diagonal
+    for r in range(rows - length + 1):
+        for c in range(columns - length + 1):
+            windows.append([(r + length - 1 - i, c + i) for i in range(length)])
+    return windows
+
+
+class WindowTables:
+    """Every window of a Geometry as board indices and bitboard masks, with the score tables."""
+
+    def __init__(self, geometry):
+        rows, columns, length, h1 = geometry.rows, geometry.columns, geometry.connect, geometry.h1
+        self.geometry = geometry
+        self.length = length
+        window_cells = _build_windows(rows, columns, length)
+        self.window_cells = window_cells
+        self.window_masks = [sum(1 << (c * h1 + r) for r, c in cells) for cells in window_cells]
+        self.center_mask = sum(1 << ((columns // 2) * h1 + r) for r in range(rows))
+        self.center_cells = {(columns // 2) * h1 + r for r in range(rows)}
+
+        # score_table[own][opp] is evaluate_window for a window holding that
+        # many of the player's and of the opponent's pieces
+        self.score_table = [[evaluate_window([AI_PLAYER] * own + [HUMAN_PLAYER] * opp
+                                             + [0] * (length - own - opp), AI_PLAYER, length)
+                             if own + opp <= length else 0
+                             for opp in range(length + 1)]
+                            for own in range(length + 1)]
+
+        # Windows through every bitboard cell, for the incremental update
+        self.cell_windows = [[] for _ in range(columns * h1)]
+        for w, cells in enumerate(window_cells):
+            for r, c in cells:
+                self.cell_windows[c * h1 + r].append(w)
+
+        # Flat version of window_scores indexed by own + (length + 1) * opp,
+        # and the step every new piece adds to that index
+        radix = length + 1
+        self.code_scores = [self.score_table[code % radix][code // radix] if code % radix + code // radix <= length
+                            else 0 for code in range(radix * radix)]
+        self.code_step = {AI_PLAYER: 1, HUMAN_PLAYER: radix}
+
+    @functools.cached_property
+    def windows(self):
+        # (69, 4) indices into board.ravel() on the standard board
+        import numpy as np
+        columns = self.geometry.columns
+        return np.array([[r * columns + c for r, c in cells] for cells in self.window_cells],
+                        dtype=np.intp).reshape(-1, self.length)
+
+    @functools.cached_property
+    def window_scores(self):
+        # score_table as an array, for scoring array boards
+        import numpy as np
+        return np.array(self.score_table, dtype=np.int64)
+
+    def evaluate_bitboards(self, own_bb, opp_bb):
+        score = ((own_bb & self.center_mask).bit_count()) * CENTER_WEIGHT
+        scores = self.score_table
+        for mask in self.window_masks:
+            score += scores[(own_bb & mask).bit_count()][(opp_bb & mask).bit_count()]
+        return score
+
+
+_STANDARD_TABLES = WindowTables(STANDARD)
+
+WINDOW_MASKS = _STANDARD_TABLES.window_masks
+CENTER_MASK = _STANDARD_TABLES.center_mask
+_SCORE_TABLE = _STANDARD_TABLES.score_table
+CELL_WINDOWS = _STANDARD_TABLES.cell_windows
+
+
+def __getattr__(name):
+    # WINDOWS and WINDOW_SCORES are NumPy arrays, only built when used
+    if name == "WINDOWS":
+        return _STANDARD_TABLES.windows
+    if name == "WINDOW_SCORES":
+        return _STANDARD_TABLES.window_scores
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@functools.lru_cache(maxsize=None)
+def window_tables(geometry):
+    return _STANDARD_TABLES if geometry == STANDARD else WindowTables(geometry)
+
+
+def evaluate_board(board, piece, geometry=STANDARD):
+    import numpy as np
+    tables = window_tables(geometry)
+    board = np.asarray(board)
+    opp_piece = HUMAN_PLAYER if piece == AI_PLAYER else AI_PLAYER
+    cells = board.ravel()[tables.windows]
+    own = np.count_nonzero(cells == piece, axis=1)
+    opp = np.count_nonzero(cells == opp_piece, axis=1)
+    center = np.count_nonzero(board[:, geometry.columns // 2] == piece)
+    return int(tables.window_scores[own, opp].sum()) + center * CENTER_WEIGHT
+
+
+def evaluate_bitboards(own_bb, opp_bb):
+    score = ((own_bb & CENTER_MASK).bit_count()) * CENTER_WEIGHT
+    scores = _SCORE_TABLE
+    for mask in WINDOW_MASKS:
+        score += scores[(own_bb & mask).bit_count()][(opp_bb & mask).bit_count()]
+    return score
+
+
+class EvaluatedPosition(Position):
+    """Position that keeps score_position(board, AI_PLAYER) up to date.
+
+    Every window remembers how many pieces of each player it holds, so a move
+    only rescores the windows through its cell.
+    """
+
+    __slots__ = ("codes", "score")
+    tables = _STANDARD_TABLES
+
+    def __init__(self):
+        super().__init__()
+        self.codes = [0] * len(self.tables.window_masks)
+        self.score = 0
+
+    @classmethod
+    def from_array(cls, board):
+        position = super().from_array(board)
+        position.refresh()
+        return position
+
+    @classmethod
+    def from_position(cls, other):
+        position = super().from_position(other)
+        position.refresh()
+        return position
+
+    def copy(self):
+        position = super().copy()
+        position.codes = list(self.codes)
+        position.score = self.score
+        return position
+
+    def refresh(self):
+        tables = self.tables
+        ai_bb = self.bitboards[AI_PLAYER]
+        human_bb = self.bitboards[HUMAN_PLAYER]
+        radix = tables.length + 1
+        self.codes = [(ai_bb & mask).bit_count() + radix * (human_bb & mask).bit_count()
+                      for mask in tables.window_masks]
+        self.score = tables.evaluate_bitboards(ai_bb, human_bb)
+
+    def play(self, col, piece):
+        cell = self.heights[col]
+        Position.play(self, col, piece)
+        self._update(cell, piece, self.tables.code_step[piece])
+
+    def undo(self):
+        col, piece = self.moves[-1]
+        Position.undo(self)
+        self._update(self.heights[col], piece, -self.tables.code_step[piece])
+        return col
+
+    def _update(self, cell, piece, step):
+        tables = self.tables
+        code_scores = tables.code_scores
+        codes = self.codes
+        score = self.score
+        for w in tables.cell_windows[cell]:
+            old = codes[w]
+            codes[w] = old + step
+            score += code_scores[old + step] - code_scores[old]
+        if piece == AI_PLAYER and cell in tables.center_cells:
+            score += CENTER_WEIGHT if step > 0 else -CENTER_WEIGHT
+        self.score = score
+
+
+@functools.lru_cache(maxsize=None)
+def evaluated_position_class(geometry):
+    # EvaluatedPosition on the board of geometry
+    if geometry == STANDARD:
+        return EvaluatedPosition
+    return type(f"EvaluatedPosition{geometry.rows}x{geometry.columns}x{geometry.connect}",
+                (EvaluatedPosition, geometry.position_class), {"__slots__": (), "tables": window_tables(geometry)})
+
+
+@functools.lru_cache(maxsize=None)
+def _cell_shifts():
+    # Bit of every board[r][c] cell, for turning bitboards back into arrays
+    import numpy as np
+    return np.array([[c * H1 + r for c in range(COLUMN_COUNT)] for r in range(ROW_COUNT)], dtype=np.uint64)
+
+
+def bitboards_to_boards(bitboards):
+    # (N, 2) masks of player 1 and player 2 -> (N, 6, 7) int8 boards
+    import numpy as np
+    bitboards = np.asarray(bitboards, dtype=np.uint64).reshape(-1, 2)
+    player1 = (bitboards[:, 0, None, None] >> _cell_shifts()) & np.uint64(1)
+    player2 = (bitboards[:, 1, None, None] >> _cell_shifts()) & np.uint64(1)
+    return (player1 + 2 * player2).astype(np.int8)
+
+
+def evaluate_batch(boards, piece=AI_PLAYER, chunk_size=65536, geometry=STANDARD):
+    """Win flags and heuristic scores for many positions at once.
+
+    ``boards`` is an (N, 6, 7) array laid out like create_board(), or
+    (N, rows, columns) for another geometry. Returns three length-N arrays:
+    whether HUMAN_PLAYER has a line, whether AI_PLAYER has, and
+    score_position(board, piece) for every board. Positions are processed
+    in chunks to bound the temporary window arrays.
+    """
+    import numpy as np
+    tables = window_tables(geometry)
+    rows, columns = geometry.rows, geometry.columns
+    boards = np.asarray(boards).reshape(-1, rows * columns)
+    opp_piece = HUMAN_PLAYER if piece == AI_PLAYER else AI_PLAYER
+    count = len(boards)
+    human_wins = np.zeros(count, dtype=bool)
+    ai_wins = np.zeros(count, dtype=bool)
+    scores = np.zeros(count, dtype=np.int64)
+    center = np.arange(rows) * columns + columns // 2
+
+    for start in range(0, count, chunk_size):
+        chunk = boards[start:start + chunk_size]
+        cells = chunk[:, tables.windows]  # (n, 69, 4)
+        own = np.count_nonzero(cells == piece, axis=2)
+        opp = np.count_nonzero(cells == opp_piece, axis=2)
+        piece_wins = (own == tables.length).any(axis=1)
+        opp_wins = (opp == tables.length).any(axis=1)
+        if piece == AI_PLAYER:
+            ai_wins[start:start + chunk_size], human_wins[start:start + chunk_size] = piece_wins, opp_wins
+        else:
+            human_wins[start:start + chunk_size], ai_wins[start:start + chunk_size] = piece_wins, opp_wins
+        scores[start:start + chunk_size] = (tables.window_scores[own, opp].sum(axis=1)
+                                            + np.count_nonzero(chunk[:, center] == piece, axis=1) * CENTER_WEIGHT)
+
+    return human_wins, ai_wins, scores
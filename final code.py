@@ -1,9 +1,21 @@
 import numpy as np
 import pygame
+import functools
 import sys
 import math
+import os
+import queue
+import threading
 import time
-from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
+
+import engine
+from engine import (AI_WIN_SCORE, HUMAN_WIN_SCORE, MCTS, STANDARD, Solver, TranspositionTable, drop_piece,
+                    get_next_open_row, get_valid_locations, is_valid_location, iterative_deepening, mcts_move,
+                    minimax, open_book, parse_variant, perfect_move)
+from game_records import GameWriter, move_string
+from ponder import Ponderer, likely_replies, ponder_tree
+from profiling import MoveProfiler
 
 # Colors
 BLUE = (0, 0, 255)
@@ -16,217 +28,112 @@ GRAY = (200, 200, 200)
 DARK_BLUE = (0, 0, 150)
 LIGHT_BLUE = (173, 216, 230)
 
-# Game constants
-ROW_COUNT = 6
-COLUMN_COUNT = 7
-SQUARESIZE = 100
+# Game constants, CONNECT4_VARIANT=9x10x5 plays on 9 rows and 10 columns to five in a row
+GEOMETRY = parse_variant(os.environ.get("CONNECT4_VARIANT", "6x7x4"))
+ROW_COUNT = GEOMETRY.rows
+COLUMN_COUNT = GEOMETRY.columns
+SQUARESIZE = min(100, 700 // COLUMN_COUNT, 700 // (ROW_COUNT + 1))  # Large boards get smaller cells
 RADIUS = int(SQUARESIZE / 2 - 5)
 BOARD_WIDTH = COLUMN_COUNT * SQUARESIZE
 INFO_PANEL_WIDTH = 400
 WINDOW_WIDTH = BOARD_WIDTH + INFO_PANEL_WIDTH
 WINDOW_HEIGHT = (ROW_COUNT + 1) * SQUARESIZE + 50
+MENU_FPS = 30  # Menus only redraw their hover effects this often
+GAME_FPS = 60
 
 # AI constants
 AI_PLAYER = 2
 HUMAN_PLAYER = 1
+AI_MOVE_TIME = 3.0  # Seconds the AI may think per move
+MIN_MOVE_DISPLAY = 1.0  # Seconds an AI move is shown as "thinking" at least
+MCTS_ITERATIONS = {2: 500, 4: 2000, 6: 8000, 8: 30000}  # Rollouts per move for each difficulty
+PONDER = os.environ.get("CONNECT4_PONDER", "1") != "0"  # Search while the human thinks, see ponder.py
 
 
-def create_board():
-    return np.zeros((ROW_COUNT, COLUMN_COUNT))
+# The rules of the game come from the engine, on the board of this game
+create_board = functools.partial(engine.create_board, GEOMETRY)
+winning_move = functools.partial(engine.winning_move, geometry=GEOMETRY)
+score_position = functools.partial(engine.score_position, geometry=GEOMETRY)
+is_terminal_node = functools.partial(engine.is_terminal_node, geometry=GEOMETRY)
 
 
-def drop_piece(board, row, col, piece):
-    board[row][col] = piece
+def print_board(board):
+    print(np.flip(board, 0))
 
 
-def is_valid_location(board, col):
-    return board[ROW_COUNT - 1][col] == 0
+def format_score(score, bound="exact"):
+    # A move evaluation for the panel, "<=" or ">=" when the search only bounded it
+    text = "inf" if score == AI_WIN_SCORE else "-inf" if score == HUMAN_WIN_SCORE else f"{score:g}"
+    return {"upper": "<=", "lower": ">="}.get(bound, "") + text
 
 
-def get_next_open_row(board, col):
-    for r in range(ROW_COUNT):
-        if board[r][col] == 0:
-            return r
+@functools.lru_cache(maxsize=None)
+def get_font(size, bold=False):
+    # Loading a system font is slow, every size is only loaded once
+    return pygame.font.SysFont("Arial", size, bold=bold)
 
 
-def print_board(board):
-    print(np.flip(board, 0))
+@functools.lru_cache(maxsize=None)
+def board_surface():
+    # The empty board, rendered once
+    surface = pygame.Surface((BOARD_WIDTH, WINDOW_HEIGHT)).convert()
+    surface.fill(DARK_BLUE)
+    for c in range(COLUMN_COUNT):
+        for r in range(ROW_COUNT):
+            surface.blit(cell_surface(0), cell_rect(r, c))
+    return surface
 
 
-def winning_move(board, piece):
-    # Check horizontal locations for win
-    for c in range(COLUMN_COUNT - 3):
-        for r in range(ROW_COUNT):
-            if board[r][c] == piece and board[r][c + 1] == piece and board[r][c + 2] == piece and board[r][
-                c + 3] == piece:
-                return True
+@functools.lru_cache(maxsize=None)
+def cell_surface(piece):
+    # One board cell holding piece, 0 for an empty hole
+    surface = pygame.Surface((SQUARESIZE, SQUARESIZE)).convert()
+    surface.fill(BLUE)
+    color = {0: BLACK, 1: RED, 2: YELLOW}[piece]
+    pygame.draw.circle(surface, color, (SQUARESIZE // 2, SQUARESIZE // 2), RADIUS)
+    return surface
 
-    # Check vertical locations for win
-    for c in range(COLUMN_COUNT):
-        for r in range(ROW_COUNT - 3):
-            if board[r][c] == piece and board[r + 1][c] == piece and board[r + 2][c] == piece and board[r + 3][
-                c] == piece:
-                return True
-
-    # Check positively sloped diagonals
-    for c in range(COLUMN_COUNT - 3):
-        for r in range(ROW_COUNT - 3):
-            if board[r][c] == piece and board[r + 1][c + 1] == piece and board[r + 2][c + 2] == piece and board[r + 3][
-                c + 3] == piece:
-                return True
-
-    # Check negatively sloped diagonals
-    for c in range(COLUMN_COUNT - 3):
-        for r in range(3, ROW_COUNT):
-            if board[r][c] == piece and board[r - 1][c + 1] == piece and board[r - 2][c + 2] == piece and board[r - 3][
-                c + 3] == piece:
-                return True
-    return False
-
-
-def evaluate_window(window, piece):
-    score = 0
-    opp_piece = HUMAN_PLAYER if piece == AI_PLAYER else AI_PLAYER
-
-    if window.count(piece) == 4:
-        score += 100
-    elif window.count(piece) == 3 and window.count(0) == 1:
-        score += 5
-    elif window.count(piece) == 2 and window.count(0) == 2:
-        score += 2
-
-    if window.count(opp_piece) == 3 and window.count(0) == 1:
-        score -= 4
-
-    return score
-
-
-def score_position(board, piece):
-    score = 0
-
-    # Score center column
-    center_array = [int(i) for i in list(board[:, COLUMN_COUNT // 2])]
-    center_count = center_array.count(piece)
-    score += center_count * 3
-
-    # Score horizontal
-    for r in range(ROW_COUNT):
-        row_array = [int(i) for i in list(board[r, :])]
-        for c in range(COLUMN_COUNT - 3):
-            window = row_array[c:c + 4]
-            score += evaluate_window(window, piece)
-
-    # Score vertical
-    for c in range(COLUMN_COUNT):
-        col_array = [int(i) for i in list(board[:, c])]
-        for r in range(ROW_COUNT - 3):
-            window = col_array[r:r + 4]
-            score += evaluate_window(window, piece)
-
-    # Score positive sloped diagonal
-    for r in range(ROW_COUNT - 3):
-        for c in range(COLUMN_COUNT - 3):
-            window = [board[r + i][c + i] for i in range(4)]
-            score += evaluate_window(window, piece)
-
-    # Score negative sloped diagonal
-    for r in range(ROW_COUNT - 3):
-        for c in range(COLUMN_COUNT - 3):
-            window = [board[r + 3 - i][c + i] for i in range(4)]
-            score += evaluate_window(window, piece)
-
-    return score
-
-
-def is_terminal_node(board):
-    return winning_move(board, HUMAN_PLAYER) or winning_move(board, AI_PLAYER) or len(get_valid_locations(board)) == 0
-
-
-def get_valid_locations(board):
-    valid_locations = []
-    for col in range(COLUMN_COUNT):
-        if is_valid_location(board, col):
-            valid_locations.append(col)
-    return valid_locations
-
-
-def minimax(board, depth, maximizingPlayer, alpha=-math.inf, beta=math.inf, use_alpha_beta=False):
-    valid_locations = get_valid_locations(board)
-    is_terminal = is_terminal_node(board)
-
-    if depth == 0 or is_terminal:
-        if is_terminal:
-            if winning_move(board, AI_PLAYER):
-                return (None, 100000000000000)
-            elif winning_move(board, HUMAN_PLAYER):
-                return (None, -10000000000000)
-            else:  # Game is over, no more valid moves
-                return (None, 0)
-        else:  # Depth is zero
-            return (None, score_position(board, AI_PLAYER))
-
-    if maximizingPlayer:
-        value = -math.inf
-        column = np.random.choice(valid_locations)
-        for col in valid_locations:
-            row = get_next_open_row(board, col)
-            b_copy = deepcopy(board)
-            drop_piece(b_copy, row, col, AI_PLAYER)
-            new_score = minimax(b_copy, depth - 1, False, alpha, beta, use_alpha_beta)[1]
-            if new_score > value:
-                value = new_score
-                column = col
-            if use_alpha_beta:
-                alpha = max(alpha, value)
-                if alpha >= beta:
-                    break
-        return column, value
-    else:  # Minimizing player
-        value = math.inf
-        column = np.random.choice(valid_locations)
-        for col in valid_locations:
-            row = get_next_open_row(board, col)
-            b_copy = deepcopy(board)
-            drop_piece(b_copy, row, col, HUMAN_PLAYER)
-            new_score = minimax(b_copy, depth - 1, True, alpha, beta, use_alpha_beta)[1]
-            if new_score < value:
-                value = new_score
-                column = col
-            if use_alpha_beta:
-                beta = min(beta, value)
-                if alpha >= beta:
-                    break
-        return column, value
 
+def cell_rect(r, c):
+    # Screen rect of board[r][c], row 0 is the bottom row
+    return pygame.Rect(c * SQUARESIZE, (ROW_COUNT - r) * SQUARESIZE, SQUARESIZE, SQUARESIZE)
 
-def draw_board(board, screen, ai_info=None):
-    # Draw the game board
-    pygame.draw.rect(screen, DARK_BLUE, (0, 0, BOARD_WIDTH, WINDOW_HEIGHT))
 
-    for c in range(COLUMN_COUNT):
-        for r in range(ROW_COUNT):
-            pygame.draw.rect(screen, BLUE, (c * SQUARESIZE, r * SQUARESIZE + SQUARESIZE, SQUARESIZE, SQUARESIZE))
-            pygame.draw.circle(screen, BLACK, (
-                int(c * SQUARESIZE + SQUARESIZE / 2), int(r * SQUARESIZE + SQUARESIZE + SQUARESIZE / 2)), RADIUS)
+# What draw_board last put on the screen, so the next call only redraws what changed
+_drawn = {"board": None, "ai_info": None}
 
-    # Draw the pieces
-    for c in range(COLUMN_COUNT):
-        for r in range(ROW_COUNT):
-            if board[r][c] == 1:
-                pygame.draw.circle(screen, RED, (
-                    int(c * SQUARESIZE + SQUARESIZE / 2), WINDOW_HEIGHT - int(r * SQUARESIZE + SQUARESIZE / 2) - 50),
-                                   RADIUS)
-            elif board[r][c] == 2:
-                pygame.draw.circle(screen, YELLOW, (
-                    int(c * SQUARESIZE + SQUARESIZE / 2), WINDOW_HEIGHT - int(r * SQUARESIZE + SQUARESIZE / 2) - 50),
-                                   RADIUS)
-
-    # Draw the info panel
+
+def draw_board(board, screen, ai_info=None, full=False):
+    dirty = []
+
+    # Draw the game board, or only the cells that changed since the last call
+    if full or _drawn["board"] is None:
+        screen.blit(board_surface(), (0, 0))
+        changed = np.argwhere(board != 0)
+        dirty.append(pygame.Rect(0, 0, BOARD_WIDTH, WINDOW_HEIGHT))
+    else:
+        changed = np.argwhere(board != _drawn["board"])
+    for r, c in changed:
+        rect = cell_rect(r, c)
+        screen.blit(cell_surface(int(board[r][c])), rect)
+        dirty.append(rect)
+
+    # Draw the info panel when its content changed
+    if full or _drawn["board"] is None or ai_info != _drawn["ai_info"]:
+        draw_info_panel(screen, ai_info)
+        dirty.append(pygame.Rect(BOARD_WIDTH, 0, INFO_PANEL_WIDTH, WINDOW_HEIGHT))
+
+    _drawn["board"] = np.array(board)
+    _drawn["ai_info"] = list(ai_info) if ai_info else ai_info
+    pygame.display.update(dirty)
+
+
+def draw_info_panel(screen, ai_info):
     pygame.draw.rect(screen, LIGHT_BLUE, (BOARD_WIDTH, 0, INFO_PANEL_WIDTH, WINDOW_HEIGHT))
 
     if ai_info:
-        font = pygame.font.SysFont("Arial", 22, bold=True)
-        title_font = pygame.font.SysFont("Arial", 26, bold=True)
+        font = get_font(22, bold=True)
+        title_font = get_font(26, bold=True)
 
         # AI Thinking Title
         title = title_font.render("AI Thinking Process", 1, DARK_BLUE)
@@ -256,15 +163,17 @@ def draw_board(board, screen, ai_info=None):
             eval_text = ai_info[ai_info.index("Move Evaluations:") + 1]
             evaluations = eval_text.split(", ")
 
-            # Draw bars for each column evaluation
+            # Draw bars for each column evaluation, as many as fit across the panel
             bar_start = eval_start + 40
+            bar_step = min(40, (INFO_PANEL_WIDTH - 70) // COLUMN_COUNT)
+            bar_width = bar_step // 2
             for i, eval_str in enumerate(evaluations):
                 if i >= COLUMN_COUNT:
                     break
 
                 try:
                     col, score = eval_str.split(": ")
-                    score = float(score)
+                    score = float(score.lstrip("<>="))
                 except:
                     continue
 
@@ -274,16 +183,14 @@ def draw_board(board, screen, ai_info=None):
                 # Draw bar
                 if bar_length >= 0:
                     pygame.draw.rect(screen, GREEN,
-                                     (BOARD_WIDTH + 50 + i * 40, bar_start + 20, 20, -bar_length))
+                                     (BOARD_WIDTH + 50 + i * bar_step, bar_start + 20, bar_width, -bar_length))
                 else:
                     pygame.draw.rect(screen, RED,
-                                     (BOARD_WIDTH + 50 + i * 40, bar_start + 20, 20, -bar_length))
+                                     (BOARD_WIDTH + 50 + i * bar_step, bar_start + 20, bar_width, -bar_length))
 
                 # Draw column number
                 col_text = font.render(str(i + 1), 1, BLACK)
-                screen.blit(col_text, (BOARD_WIDTH + 50 + i * 40, bar_start + 50))
-
-    pygame.display.update()
+                screen.blit(col_text, (BOARD_WIDTH + 50 + i * bar_step, bar_start + 50))
 
 
 def draw_button(screen, rect, text, font, color, hover_color, text_color=WHITE):
@@ -302,8 +209,8 @@ def draw_button(screen, rect, text, font, color, hover_color, text_color=WHITE):
 
 def draw_game_setup(screen):
     screen.fill(LIGHT_BLUE)
-    title_font = pygame.font.SysFont("Arial", 40, bold=True)
-    button_font = pygame.font.SysFont("Arial", 28)
+    title_font = get_font(40, bold=True)
+    button_font = get_font(28)
 
     # Title
     title = title_font.render("Connect Four", 1, DARK_BLUE)
@@ -331,6 +238,7 @@ def draw_game_setup(screen):
 
     pygame.display.update()
 
+    clock = pygame.time.Clock()
     while True:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
@@ -353,13 +261,14 @@ def draw_game_setup(screen):
         buttons.append(draw_button(screen, cvh_button, "AI vs Human", button_font, BLUE, DARK_BLUE))
         buttons.append(draw_button(screen, cvc_button, "AI vs AI", button_font, BLUE, DARK_BLUE))
 
-        pygame.display.update()
+        pygame.display.update([hvh_button, hvc_button, cvh_button, cvc_button])
+        clock.tick(MENU_FPS)
 
 
 def select_ai_difficulty(screen):
     screen.fill(LIGHT_BLUE)
-    title_font = pygame.font.SysFont("Arial", 32, bold=True)
-    button_font = pygame.font.SysFont("Arial", 24)
+    title_font = get_font(32, bold=True)
+    button_font = get_font(24)
 
     # Title
     title = title_font.render("Select AI Difficulty Level", 1, DARK_BLUE)
@@ -373,6 +282,7 @@ def select_ai_difficulty(screen):
     medium_button = pygame.Rect(button_x, 200, button_width, button_height)
     hard_button = pygame.Rect(button_x, 270, button_width, button_height)
     expert_button = pygame.Rect(button_x, 340, button_width, button_height)
+    perfect_button = pygame.Rect(button_x, 410, button_width, button_height)
 
     # Draw buttons
     buttons = []
@@ -380,14 +290,16 @@ def select_ai_difficulty(screen):
     buttons.append(draw_button(screen, medium_button, "Medium", button_font, YELLOW, (200, 200, 0), BLACK))
     buttons.append(draw_button(screen, hard_button, "Hard", button_font, (255, 165, 0), (200, 100, 0), WHITE))
     buttons.append(draw_button(screen, expert_button, "Expert", button_font, RED, (200, 0, 0), WHITE))
+    buttons.append(draw_button(screen, perfect_button, "Perfect", button_font, DARK_BLUE, BLACK, WHITE))
 
     # Difficulty descriptions
-    desc_font = pygame.font.SysFont("Arial", 16)
+    desc_font = get_font(16)
     descriptions = [
         "Depth: 2 - Basic AI with limited lookahead",
         "Depth: 4 - Moderate AI with decent strategy",
         "Depth: 6 - Strong AI with good planning",
-        "Depth: 8 - Expert AI with deep lookahead"
+        "Depth: 8 - Expert AI with deep lookahead",
+        "Solver - Plays perfectly once the game can be solved"
     ]
 
     for i, desc in enumerate(descriptions):
@@ -396,6 +308,7 @@ def select_ai_difficulty(screen):
 
     pygame.display.update()
 
+    clock = pygame.time.Clock()
     while True:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
@@ -410,6 +323,9 @@ def select_ai_difficulty(screen):
                     return select_ai_algorithm(screen, 6)  # Hard
                 elif buttons[3]:
                     return select_ai_algorithm(screen, 8)  # Expert
+                elif buttons[4]:
+                    # Exact solver, Expert alpha-beta while the position is too open to solve in time
+                    return {"depth": 8, "use_alpha_beta": True, "time_budget": AI_MOVE_TIME, "perfect": True}
 
         # Update button hover effects
         buttons = []
@@ -417,15 +333,17 @@ def select_ai_difficulty(screen):
         buttons.append(draw_button(screen, medium_button, "Medium", button_font, YELLOW, (200, 200, 0), BLACK))
         buttons.append(draw_button(screen, hard_button, "Hard", button_font, (255, 165, 0), (200, 100, 0), WHITE))
         buttons.append(draw_button(screen, expert_button, "Expert", button_font, RED, (200, 0, 0), WHITE))
+        buttons.append(draw_button(screen, perfect_button, "Perfect", button_font, DARK_BLUE, BLACK, WHITE))
 
-        pygame.display.update()
+        pygame.display.update([easy_button, medium_button, hard_button, expert_button, perfect_button])
+        clock.tick(MENU_FPS)
 
 
 def select_ai_algorithm(screen, depth):
     screen.fill(LIGHT_BLUE)
-    title_font = pygame.font.SysFont("Arial", 32, bold=True)
-    button_font = pygame.font.SysFont("Arial", 24)
-    desc_font = pygame.font.SysFont("Arial", 18)
+    title_font = get_font(32, bold=True)
+    button_font = get_font(24)
+    desc_font = get_font(18)
 
     # Title
     title = title_font.render("Select AI Algorithm", 1, DARK_BLUE)
@@ -437,11 +355,13 @@ def select_ai_algorithm(screen, depth):
 
     minimax_button = pygame.Rect(button_x, 150, button_width, button_height)
     alphabeta_button = pygame.Rect(button_x, 250, button_width, button_height)
+    mcts_button = pygame.Rect(button_x, 400, button_width, button_height)
 
     # Draw buttons
     buttons = []
     buttons.append(draw_button(screen, minimax_button, "Minimax", button_font, BLUE, DARK_BLUE))
     buttons.append(draw_button(screen, alphabeta_button, "Alpha-Beta Pruning", button_font, BLUE, DARK_BLUE))
+    buttons.append(draw_button(screen, mcts_button, "Monte Carlo Tree Search", button_font, BLUE, DARK_BLUE))
 
     # Algorithm descriptions
     minimax_desc = [
@@ -456,6 +376,12 @@ def select_ai_algorithm(screen, depth):
         "Faster but same results as Minimax"
     ]
 
+    mcts_desc = [
+        "Plays thousands of random games",
+        "Gets stronger the longer it thinks",
+        "Strong positional play"
+    ]
+
     for i, line in enumerate(minimax_desc):
         text = desc_font.render(line, 1, DARK_BLUE)
         screen.blit(text, (button_x, 150 + button_height + 10 + i * 25))
@@ -464,8 +390,13 @@ def select_ai_algorithm(screen, depth):
         text = desc_font.render(line, 1, DARK_BLUE)
         screen.blit(text, (button_x, 250 + button_height + 10 + i * 25))
 
+    for i, line in enumerate(mcts_desc):
+        text = desc_font.render(line, 1, DARK_BLUE)
+        screen.blit(text, (button_x, 400 + button_height + 10 + i * 25))
+
     pygame.display.update()
 
+    clock = pygame.time.Clock()
     while True:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
@@ -473,16 +404,21 @@ def select_ai_algorithm(screen, depth):
                 sys.exit()
             if event.type == pygame.MOUSEBUTTONDOWN:
                 if buttons[0]:
-                    return {"depth": depth, "use_alpha_beta": False}
+                    return {"depth": depth, "use_alpha_beta": False, "time_budget": AI_MOVE_TIME}
                 elif buttons[1]:
-                    return {"depth": depth, "use_alpha_beta": True}
+                    return {"depth": depth, "use_alpha_beta": True, "time_budget": AI_MOVE_TIME}
+                elif buttons[2]:
+                    return {"depth": depth, "use_alpha_beta": False, "time_budget": AI_MOVE_TIME, "mcts": True,
+                            "iterations": MCTS_ITERATIONS[depth]}
 
         # Update button hover effects
         buttons = []
         buttons.append(draw_button(screen, minimax_button, "Minimax", button_font, BLUE, DARK_BLUE))
         buttons.append(draw_button(screen, alphabeta_button, "Alpha-Beta Pruning", button_font, BLUE, DARK_BLUE))
+        buttons.append(draw_button(screen, mcts_button, "Monte Carlo Tree Search", button_font, BLUE, DARK_BLUE))
 
-        pygame.display.update()
+        pygame.display.update([minimax_button, alphabeta_button, mcts_button])
+        clock.tick(MENU_FPS)
 
 
 def main():
@@ -496,23 +432,104 @@ def main():
     board = create_board()
     print_board(board)
     game_over = False
+    # Positions repeat from one move to the next, so the table lives for the whole game
+    tt = TranspositionTable() if ai_settings and ai_settings["use_alpha_beta"] else None
+    # The solver only knows the standard board, on variants Perfect plays Expert
+    solver = Solver() if ai_settings and ai_settings.get("perfect") and GEOMETRY == STANDARD else None
+    # The tree is reused from move to move
+    mcts = MCTS(geometry=GEOMETRY) if ai_settings and ai_settings.get("mcts") else None
+    profiler = MoveProfiler.from_env()  # Per-move statistics and profiles, see profiling.py
+    book = open_book()  # None unless opening_book.py has been run
+    # Logs the game when CONNECT4_GAMES names a file, see game_records.py, standard board only
+    recorder = GameWriter.from_env() if GEOMETRY == STANDARD else None
+    moves = []  # Columns played, for the game record
     turn = 0  # 0 for player 1 (human), 1 for player 2 (human or AI)
+    ai_turn = 1 if game_mode == "hvc" else 0  # The AI's turn when it plays a human
 
     # Font for messages
-    myfont = pygame.font.SysFont("Arial", 60, bold=True)
-    smallfont = pygame.font.SysFont("Arial", 20)
+    myfont = get_font(60, bold=True)
+    smallfont = get_font(20)
+
+    # The AI searches on a worker thread so the window keeps responding
+    executor = ThreadPoolExecutor(max_workers=1)
+    ai_future = None
+    stop_search = None  # Set to make the AI move now
+    progress = queue.Queue()  # Progress messages from the search
+    move_due = 0  # Ticks when the AI move may be shown, at least MIN_MOVE_DISPLAY after it started
+
+    def search(board, turn, stop, report=None):
+        # The AI move for turn, report(message) follows its progress
+        depth_progress = None if report is None else (
+            lambda depth, col, score: report(f"Depth {depth}, best column {col + 1}"))
+        if solver is not None:
+            return perfect_move(
+                board, turn + 1, ai_settings["time_budget"], solver=solver, stop=stop,
+                multi_pv=True, max_depth=ai_settings["depth"], use_alpha_beta=True, tt=tt, book=book,
+                use_threats=True, timing=profiler.timing, progress=depth_progress)
+        elif mcts is not None:
+            return mcts_move(board, turn + 1, mcts, iterations=ai_settings["iterations"],
+                             time_budget=ai_settings["time_budget"], stop=stop, count_reused=pondering,
+                             progress=None if report is None else lambda rollouts, col, score: report(
+                                 f"{rollouts} rollouts, best column {col + 1}"))
+        return iterative_deepening(
+            board,
+            True if (turn == 1 and game_mode == "hvc") or (turn == 0 and game_mode == "cvh") or (
+                    game_mode == "cvc" and turn == 1) else False,
+            max_depth=ai_settings["depth"],
+            time_budget=ai_settings["time_budget"],
+            use_alpha_beta=ai_settings["use_alpha_beta"],
+            tt=tt,
+            book=book,
+            use_threats=ai_settings["use_alpha_beta"],
+            timing=profiler.timing,
+            stop=stop,
+            progress=depth_progress,
+            multi_pv=True,
+            geometry=GEOMETRY
+        )
+
+    # Against a human the AI searches the likely human replies while the human thinks,
+    # MCTS grows its tree instead. Both only use the fixed-size tables above.
+    pondering = PONDER and game_mode in ("hvc", "cvh")
+    ponderer = Ponderer(lambda board, stop: search(board, ai_turn, stop)) if pondering and mcts is None else None
+    ponder_future = None
+    ponder_stop = None  # Ends the MCTS pondering
+
+    def stop_pondering():
+        if ponderer is not None:
+            ponderer.cancel()
+        if ponder_stop is not None:
+            ponder_stop.set()
+    game_over_at = None
+    clock = pygame.time.Clock()
 
     # Clear the screen
     screen.fill(BLACK)
-    draw_board(board, screen)
-    pygame.display.update()
+    draw_board(board, screen, full=True)
 
-    while not game_over:
+    while game_over_at is None or pygame.time.get_ticks() - game_over_at < 3000:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                # Cancel a running search instead of waiting for it
+                if stop_search is not None:
+                    stop_search.set()
+                stop_pondering()
+                executor.shutdown(wait=False)
+                if recorder is not None and moves:
+                    recorder.append(move_string(moves))
                 pygame.quit()
                 sys.exit()
 
+            # Space, Enter or Escape stops the search, the AI plays the best move found so far
+            # and the game goes on
+            if event.type == pygame.KEYDOWN and event.key in (pygame.K_SPACE, pygame.K_RETURN, pygame.K_ESCAPE) \
+                    and stop_search is not None:
+                stop_search.set()
+                stop_pondering()  # The search of the reply played may still be running
+
+            if game_over:
+                continue
+
             # Handle mouse motion for human players
             if (game_mode == "hvh" or
                     (game_mode == "hvc" and turn == 0) or
@@ -526,10 +543,11 @@ def main():
                             pygame.draw.circle(screen, RED, (posx, int(SQUARESIZE / 2)), RADIUS)
                         else:
                             pygame.draw.circle(screen, YELLOW, (posx, int(SQUARESIZE / 2)), RADIUS)
-                    pygame.display.update()
+                    pygame.display.update((0, 0, BOARD_WIDTH, SQUARESIZE))
 
                 if event.type == pygame.MOUSEBUTTONDOWN and event.pos[0] < BOARD_WIDTH:
                     pygame.draw.rect(screen, BLACK, (0, 0, BOARD_WIDTH, SQUARESIZE))
+                    pygame.display.update((0, 0, BOARD_WIDTH, SQUARESIZE))
 
                     # Human move
                     posx = event.pos[0]
@@ -538,10 +556,25 @@ def main():
                     if is_valid_location(board, col):
                         row = get_next_open_row(board, col)
                         drop_piece(board, row, col, turn + 1)
+                        moves.append(col)
+
+                        # Keep only the pondering on this move
+                        if ponder_future is not None:
+                            if ponderer is not None:
+                                ponderer.play(col)
+                            else:
+                                ponder_stop.set()
+                            ponder_future = None
 
                         if winning_move(board, turn + 1):
                             label = myfont.render(f"Player {turn + 1} wins!!", 1, RED if turn == 0 else YELLOW)
                             screen.blit(label, (40, 10))
+                            pygame.display.update((0, 0, BOARD_WIDTH, SQUARESIZE))
+                            game_over = True
+                        elif not get_valid_locations(board):
+                            label = myfont.render("Draw!!", 1, WHITE)
+                            screen.blit(label, (40, 10))
+                            pygame.display.update((0, 0, BOARD_WIDTH, SQUARESIZE))
                             game_over = True
 
                         print_board(board)
@@ -551,62 +584,118 @@ def main():
                         turn %= 2
 
         # AI move
-        if not game_over and ((game_mode == "hvc" and turn == 1) or
-                              (game_mode == "cvh" and turn == 0) or
-                              (game_mode == "cvc")):
+        if not game_over and ai_future is None and ((game_mode == "hvc" and turn == 1) or
+                                                    (game_mode == "cvh" and turn == 0) or
+                                                    (game_mode == "cvc")):
 
             # Display thinking message
-            thinking_text = smallfont.render("AI is thinking...", 1, DARK_BLUE)
+            thinking_text = smallfont.render("AI is thinking... (Space: move now)", 1, DARK_BLUE)
             screen.blit(thinking_text, (BOARD_WIDTH + 20, WINDOW_HEIGHT - 50))
-            pygame.display.update()
-
-            # Get AI move with evaluation of all possible moves
-            start_time = time.time()
-
-            # First evaluate all possible moves to show in the UI
-            valid_locations = get_valid_locations(board)
-            evaluations = []
-            for col in valid_locations:
-                row = get_next_open_row(board, col)
-                temp_board = deepcopy(board)
-                drop_piece(temp_board, row, col, AI_PLAYER if (turn == 1 or game_mode == "cvc") else HUMAN_PLAYER)
-                score = score_position(temp_board, AI_PLAYER if (turn == 1 or game_mode == "cvc") else HUMAN_PLAYER)
-                evaluations.append(f"{col}: {score}")
-
-            # Then get the actual move using minimax
-            col, minimax_score = minimax(
-                board,
-                ai_settings["depth"],
-                True if (turn == 1 and game_mode == "hvc") or (turn == 0 and game_mode == "cvh") or (
-                            game_mode == "cvc" and turn == 1) else False,
-                use_alpha_beta=ai_settings["use_alpha_beta"]
-            )
-            thinking_time = time.time() - start_time
+            pygame.display.update((BOARD_WIDTH, WINDOW_HEIGHT - 50, INFO_PANEL_WIDTH, 25))
+
+            # Get the move using minimax, as deep as the time budget allows. The same search
+            # scores every move for the panel
+            if tt is not None:
+                tt.reset_stats()
+            stop_search = threading.Event()
+            move_due = pygame.time.get_ticks() + int(MIN_MOVE_DISPLAY * 1000)
+
+            def move(board=board.copy(), turn=turn, stop=stop_search, reply=moves[-1] if moves else None):
+                # Runs after the pondering, so a search of the human's move has its result by now
+                pondered = ponderer.result(reply) if ponderer is not None and reply is not None else None
+                if pondered is not None:
+                    column, score, info = pondered
+                    return column, score, dict(info, pondered=True)
+                with profiler.measure():
+                    column, score, info = search(board, turn, stop, progress.put)
+                # The tree grown while the human thought already held all the rollouts
+                if pondering and mcts is not None:
+                    info["pondered"] = info["reused_visits"] >= ai_settings["iterations"]
+                return column, score, info
+
+            ai_future = executor.submit(move)
+
+        # Show the progress of the search while it runs
+        while not progress.empty():
+            pygame.draw.rect(screen, LIGHT_BLUE, (BOARD_WIDTH, WINDOW_HEIGHT - 25, INFO_PANEL_WIDTH, 25))
+            progress_text = smallfont.render(progress.get(), 1, DARK_BLUE)
+            screen.blit(progress_text, (BOARD_WIDTH + 20, WINDOW_HEIGHT - 25))
+            pygame.display.update((BOARD_WIDTH, WINDOW_HEIGHT - 25, INFO_PANEL_WIDTH, 25))
+
+        # Play the AI move once it is found and has been shown as thinking long enough,
+        # a move found while the human thought is played right away
+        if ai_future is not None and ai_future.done() and (pygame.time.get_ticks() >= move_due or
+                                                           ai_future.result()[2].get("pondered")):
+            col, minimax_score, search_info = ai_future.result()
+            ai_future = stop_search = None
+            thinking_time = search_info["elapsed"]
+            profiler.record(col, minimax_score, search_info, player=turn + 1)
 
             if is_valid_location(board, col):
+                # Move evaluations from the search itself, none for a book move
+                move_bounds = search_info.get("move_bounds", {})
+                evaluations = [f"{move}: {format_score(score, move_bounds.get(move, 'exact'))}"
+                               for move, score in search_info.get("move_scores", {}).items()]
+                pv = search_info.get("pv")
+                if solver is not None:
+                    algorithm = "Perfect Solver"
+                elif mcts is not None:
+                    algorithm = "Monte Carlo Tree Search"
+                else:
+                    algorithm = "Alpha-Beta" if ai_settings["use_alpha_beta"] else "Minimax"
+                stats = search_info.get("stats")
+                if search_info.get("solved"):
+                    depth_line = f"Solved: {search_info['result']} in {search_info['depth']} moves"
+                elif mcts is not None:
+                    depth_line = f"Rollouts: {search_info['nodes']} (tree depth {search_info['depth']})"
+                else:
+                    depth_line = f"Search Depth: {search_info['depth']} of {ai_settings['depth']}" + (
+                        " (book)" if search_info["book"] else "")
                 # Prepare AI info to display
                 ai_info = [
                     f"AI Player: {'Yellow' if turn == 1 else 'Red'}",
-                    f"Algorithm: {'Alpha-Beta' if ai_settings['use_alpha_beta'] else 'Minimax'}",
-                    f"Search Depth: {ai_settings['depth']}",
+                    f"Algorithm: {algorithm}",
+                    depth_line,
                     f"Thinking Time: {thinking_time:.2f} seconds",
+                    f"Tree Size: {search_info['allocations']} nodes" if mcts is not None else
+                    f"Nodes: {search_info['nodes']} ({search_info['allocations']} boards allocated)",
+                    f"TT Hit Rate: {tt.hit_rate():.0%}" if tt is not None else "",
+                    f"Branching Factor: {search_info['branching_factors'][-1]:.2f}"
+                    if search_info["branching_factors"] else "",
+                    f"Threat Pruning: {sum(search_info['pruned'].values())} moves skipped"
+                    if ai_settings["use_alpha_beta"] and "pruned" in search_info else "",
+                    f"Cutoffs: {stats['cutoffs']} ({stats['first_move_cutoff_rate']:.0%} by first move)"
+                    if stats and ai_settings["use_alpha_beta"] else "",
+                    f"Leaf Evaluations: {stats['leaf_evaluations']}, TT Hits: {stats['tt_hits']}" if stats else "",
+                    "Time ms (eval/moves/wins): " + "/".join(f"{seconds * 1000:.0f}" for seconds in
+                                                              stats["seconds"].values())
+                    if stats and "seconds" in stats else "",
+                    (f"Pondering: {'hit' if search_info.get('pondered') else 'miss'}, "
+                     f"{ponderer.hits} of {ponderer.hits + ponderer.misses} moves") if ponderer is not None else
+                    f"Pondering: {search_info['reused_visits']} rollouts reused" if pondering else "",
                     "",
                     f"Move Selected: Column {col + 1}",
-                    f"Move Score: {minimax_score}",
+                    f"Move Score: {minimax_score}" + ("% win chance" if mcts is not None else ""),
+                    f"Expected Line: {' '.join(str(move + 1) for move in pv)}" if pv else "",
                     "",
                     "Move Evaluations:",
                     ", ".join(evaluations)
                 ]
 
-                pygame.time.wait(1000)  # Pause to show thinking
-
                 row = get_next_open_row(board, col)
                 drop_piece(board, row, col, turn + 1)
+                moves.append(col)
 
                 if winning_move(board, turn + 1):
                     winner_text = f"AI Player {turn + 1} wins!!" if game_mode == "cvc" else f"AI wins!!"
                     label = myfont.render(winner_text, 1, RED if turn == 0 else YELLOW)
                     screen.blit(label, (40, 10))
+                    pygame.display.update((0, 0, BOARD_WIDTH, SQUARESIZE))
+                    game_over = True
+                elif not get_valid_locations(board):
+                    label = myfont.render("Draw!!", 1, WHITE)
+                    screen.blit(label, (40, 10))
+                    pygame.display.update((0, 0, BOARD_WIDTH, SQUARESIZE))
                     game_over = True
 
                 print_board(board)
@@ -615,8 +704,27 @@ def main():
                 turn += 1
                 turn %= 2
 
-        if game_over:
-            pygame.time.wait(3000)
+        # Ponder while the human thinks, until the human moves
+        if pondering and not game_over and ponder_future is None and ai_future is None and turn != ai_turn:
+            if ponderer is not None:
+                replies = likely_replies(board, turn + 1, tt, False, GEOMETRY)
+                ponder_future = ponderer.submit(executor, board, turn + 1, replies)
+            else:
+                position = GEOMETRY.position_class.from_array(board)
+                ponder_stop = threading.Event()
+                ponder_future = executor.submit(ponder_tree, mcts, position.bitboards[turn + 1], position.mask(),
+                                                ponder_stop)
+
+        # Keep the window on screen a few seconds after the game ends
+        if game_over and game_over_at is None:
+            game_over_at = pygame.time.get_ticks()
+
+        clock.tick(GAME_FPS)
+
+    stop_pondering()
+    executor.shutdown()
+    if recorder is not None:
+        recorder.append(move_string(moves))
 
 
 if __name__ == "__main__":
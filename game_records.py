@@ -0,0 +1,263 @@
+"""Compact game records, an append-only log and a position index over it.
+
+A record file is a small header followed by one record per game: the number
+of moves, the result and the moves packed two columns to a byte, so a full
+42-move game takes 23 bytes. Games are only ever appended, each with a
+single write, so the game, tournament.py and server.py can all log to the
+same file and a crash can cost at most the last, partial record.
+
+    CONNECT4_GAMES=games.c4g python "final code.py"   # log every game played
+    python game_records.py index games.c4g --plies 12
+    python game_records.py stats games.c4g --moves 44
+
+read_games() streams the records one at a time, so any number of games can
+be replayed without loading the file. An index file maps the key of every
+position reached in the first --plies moves to the offsets of the games
+that reached it, sorted and memory-mapped like the opening book, so finding
+all games through a position, transpositions included, is a binary search.
+Positions are indexed under their canonical key, so a lookup finds the games
+through the mirror image as well.
+"""
+import argparse
+import collections
+import os
+import struct
+import sys
+from array import array
+
+from bitboard import COLUMN_COUNT, ROW_COUNT, Position
+
+MAGIC = b"C4GR"
+INDEX_MAGIC = b"C4GI"
+VERSION = 1
+INDEX_VERSION = 2  # Version 1 indexed plain keys, without mirror images
+_HEADER = struct.Struct("<4sI")
+# magic, version, entry count, plies covered
+_INDEX_HEADER = struct.Struct("<4sIQI")
+
+# Result codes
+UNFINISHED, FIRST_WINS, SECOND_WINS, DRAW = 0, 1, 2, 3
+RESULT_NAMES = {UNFINISHED: "unfinished", FIRST_WINS: "first", SECOND_WINS: "second", DRAW: "draw"}
+MAX_MOVES = ROW_COUNT * COLUMN_COUNT
+
+GameRecord = collections.namedtuple("GameRecord", "offset moves result")
+
+
+def move_string(columns):
+    # Columns counted from 0, as the game and the engines use them, to "4453..."
+    return "".join(str(col + 1) for col in columns)
+
+
+def game_result(moves):
+    # Raises ValueError for an illegal move or moves after the game was won
+    position = Position()
+    for ply, move in enumerate(moves):
+        col = int(move) - 1
+        if not 0 <= col < COLUMN_COUNT or not position.can_play(col):
+            raise ValueError(f"Illegal move {move!r} at ply {ply + 1}")
+        piece = 1 if ply % 2 == 0 else 2
+        position.play(col, piece)
+        if position.is_win(piece):
+            if ply + 1 < len(moves):
+                raise ValueError(f"Moves continue after the game was won at ply {ply + 1}")
+            return piece
+    return DRAW if len(moves) == MAX_MOVES else UNFINISHED
+
+
+def pack_record(moves, result):
+    packed = bytearray((len(moves), result))
+    for i in range(0, len(moves), 2):
+        high = int(moves[i + 1]) if i + 1 < len(moves) else 0
+        packed.append(int(moves[i]) | high << 4)
+    return bytes(packed)
+
+
+def _unpack_moves(data, count):
+    moves = []
+    for byte in data:
+        moves.append(byte & 15)
+        moves.append(byte >> 4)
+    return "".join(map(str, moves[:count]))
+
+
+class GameWriter:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(_HEADER.pack(MAGIC, VERSION))
+            self.file.flush()
+        else:
+            _check_header(path)
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        # None unless CONNECT4_GAMES names a record file
+        path = environ.get("CONNECT4_GAMES")
+        return cls(path) if path else None
+
+    def append(self, moves):
+        """Validates and logs one game given as a move string, returns its result code."""
+        moves = str(moves)
+        result = game_result(moves)
+        self.file.write(pack_record(moves, result))
+        self.file.flush()
+        return result
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _check_header(path):
+    with open(path, "rb") as f:
+        magic, version = _HEADER.unpack(f.read(_HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} game record file")
+
+
+def _read_record(f):
+    offset = f.tell()
+    head = f.read(2)
+    if len(head) < 2:
+        return None
+    count, result = head
+    size = (count + 1) // 2
+    data = f.read(size)
+    if len(data) < size:
+        return None  # A record cut short by a crash while it was written
+    return GameRecord(offset, _unpack_moves(data, count), result)
+
+
+def read_games(path):
+    """Yields a GameRecord for every game in the file, reading as it goes."""
+    _check_header(path)
+    with open(path, "rb", buffering=1 << 20) as f:
+        f.seek(_HEADER.size)
+        while True:
+            record = _read_record(f)
+            if record is None:
+                return
+            yield record
+
+
+def read_game(f, offset):
+    f.seek(offset)
+    return _read_record(f)
+
+
+def default_index_path(path):
+    return path + ".idx"
+
+
+def build_index(path, plies=12, index_path=None):
+    import numpy as np
+
+    # Keys and offsets are gathered in compact arrays, 16 bytes per position
+    keys, offsets = array("Q"), array("Q")
+    for record in read_games(path):
+        position = Position()
+        keys.append(position.canonical_key()[0])
+        offsets.append(record.offset)
+        for ply, move in enumerate(record.moves[:plies]):
+            position.play(int(move) - 1, 1 if ply % 2 == 0 else 2)
+            keys.append(position.canonical_key()[0])
+            offsets.append(record.offset)
+    keys = np.frombuffer(keys, dtype=np.uint64)
+    offsets = np.frombuffer(offsets, dtype=np.uint64)
+    # Stable, so the games of every position stay in file order
+    order = np.argsort(keys, kind="stable")
+    with open(index_path or default_index_path(path), "wb") as f:
+        f.write(_INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(keys), plies))
+        f.write(keys[order].astype("<u8").tobytes())
+        f.write(offsets[order].astype("<u8").tobytes())
+    return len(keys)
+
+
+class GameIndex:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            magic, version, count, plies = _INDEX_HEADER.unpack(f.read(_INDEX_HEADER.size))
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"{path} is not a version {INDEX_VERSION} game index, build it again")
+        import numpy as np
+        self.path = path
+        self.plies = plies
+        self.keys = np.memmap(path, dtype="<u8", mode="r", offset=_INDEX_HEADER.size, shape=(count,))
+        self.offsets = np.memmap(path, dtype="<u8", mode="r", offset=_INDEX_HEADER.size + 8 * count,
+                                 shape=(count,))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, position):
+        # Offsets of every game that reached position or its mirror image, empty past the indexed plies
+        import numpy as np
+        key = np.uint64(position.canonical_key()[0])
+        start = int(np.searchsorted(self.keys, key, side="left"))
+        end = int(np.searchsorted(self.keys, key, side="right"))
+        return self.offsets[start:end]
+
+
+def games_through(path, index, moves):
+    """Yields every recorded game that reached the position after moves, in any move order
+    or as its mirror image."""
+    position = Position.from_moves(moves)
+    with open(path, "rb") as f:
+        for offset in index.lookup(position):
+            yield read_game(f, int(offset))
+
+
+def move_stats(path, index, moves=""):
+    """Opening statistics: for every column played from the position after moves,
+    how many games went on with it and how they ended."""
+    stats = {}
+    ply = len(moves)
+    key = Position.from_moves(moves).key()
+    for record in games_through(path, index, moves):
+        if len(record.moves) <= ply:
+            continue
+        column = int(record.moves[ply])
+        # A game through the mirror image went on with the mirrored column
+        if Position.from_moves(record.moves[:ply]).key() != key:
+            column = COLUMN_COUNT + 1 - column
+        counts = stats.setdefault(column, dict.fromkeys(["games"] + list(RESULT_NAMES.values()), 0))
+        counts["games"] += 1
+        counts[RESULT_NAMES[record.result]] += 1
+    return dict(sorted(stats.items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index and mine game record files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    index_parser = commands.add_parser("index", help="build the position index of a record file")
+    index_parser.add_argument("records")
+    index_parser.add_argument("--plies", type=int, default=12, help="index the positions of the first moves")
+    stats_parser = commands.add_parser("stats", help="moves played from a position and their results")
+    stats_parser.add_argument("records")
+    stats_parser.add_argument("--moves", default="", help="the position, as the columns played (1-7)")
+    dump_parser = commands.add_parser("dump", help="print every game as a move string and its result")
+    dump_parser.add_argument("records")
+    args = parser.parse_args(argv)
+
+    if args.command == "index":
+        count = build_index(args.records, args.plies)
+        print(f"Indexed {count} positions into {default_index_path(args.records)}", file=sys.stderr)
+    elif args.command == "stats":
+        index = GameIndex(default_index_path(args.records))
+        if len(args.moves) > index.plies:
+            parser.error(f"the index only covers the first {index.plies} moves")
+        for column, counts in move_stats(args.records, index, args.moves).items():
+            print(f"{column}: " + ", ".join(f"{name} {count}" for name, count in counts.items()))
+    else:
+        for record in read_games(args.records):
+            print(record.moves, RESULT_NAMES[record.result])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""Monte Carlo tree search (UCT), an anytime alternative to minimax.
+
+Every iteration walks down the tree by the UCT rule, adds one node and
+finishes the game with a random rollout on two bitboard integers. Rollouts
+always take an immediate win, which keeps them short and less noisy. The
+more iterations, the better the move, so the engine gets stronger smoothly
+with the time it is given instead of in whole plies.
+
+The tree lives in flat per-node lists with a free list. It is kept between
+moves: the next search starts from the node of the position actually
+reached, and every node outside that subtree is recycled. Once max_nodes
+nodes are in use the tree stops growing and iterations only roll out.
+Symmetric positions, like the empty board, only expand the moves on one
+side, their mirror images would only split the same statistics.
+Every board Geometry works, the standard one is the default.
+"""
+import math
+import random
+import time
+
+from bitboard import STANDARD, Position, geometry as make_geometry
+
+DEFAULT_ITERATIONS = 10000
+EXPLORATION = math.sqrt(2)
+
+# Node state besides statistics
+_OPEN, _WIN, _DRAW = 0, 1, 2
+
+
+def _play(current, mask, col, geometry=STANDARD):
+    # Returns the position after col from the other side's point of view
+    return current ^ mask, mask | ((mask + geometry.column_bottoms[col]) & geometry.column_masks[col])
+
+
+def rollout(current, mask, rng, geometry=STANDARD):
+    # 1 if the side to move wins a random game from here, 0 if it loses, 0.5 for a draw
+    playable_cells, winning_cells = geometry.playable_cells, geometry.winning_cells
+    column_masks = list(enumerate(geometry.column_masks))
+    turn = 0
+    while True:
+        playable = playable_cells(mask)
+        if not playable:
+            return 0.5
+        if winning_cells(current, mask) & playable:
+            return 1.0 if turn == 0 else 0.0
+        col = rng.choice([c for c, column_mask in column_masks if playable & column_mask])
+        current, mask = _play(current, mask, col, geometry)
+        turn ^= 1
+
+
+class MCTS:
+    def __init__(self, max_nodes=200000, exploration=EXPLORATION, seed=None, geometry=STANDARD):
+        self.max_nodes = max_nodes
+        self.exploration = exploration
+        self.geometry = geometry
+        self.rng = random.Random(seed)
+        # Per node: column played into it, children by column, untried columns,
+        # visits and the wins of the side that played into it
+        self.moves = []
+        self.children = []
+        self.untried = []
+        self.visits = []
+        self.wins = []
+        self.states = []
+        self.free = []
+        self.root = None
+        self.root_position = None  # (stones of the side to move, mask), as the tree sees it
+        self.mirrored = False  # The tree holds the mirror image of the position searched
+
+    def __len__(self):
+        return len(self.moves) - len(self.free)
+
+    def _new_node(self, move, current, mask):
+        geometry = self.geometry
+        playable = geometry.playable_cells(mask)
+        if geometry.has_won(current ^ mask):  # The side that just moved has won
+            state = _WIN
+        elif not playable:
+            state = _DRAW
+        else:
+            state = _OPEN
+        untried = [] if state != _OPEN else [c for c, column_mask in enumerate(geometry.column_masks)
+                                             if playable & column_mask]
+        # A symmetric position only gets the moves on one side
+        if untried and geometry.mirror(current + mask) == current + mask:
+            untried = [c for c in untried if 2 * c < geometry.columns]
+        self.rng.shuffle(untried)
+        if self.free:
+            node = self.free.pop()
+            self.moves[node], self.children[node], self.untried[node] = move, {}, untried
+            self.visits[node], self.wins[node], self.states[node] = 0, 0.0, state
+        else:
+            node = len(self.moves)
+            self.moves.append(move)
+            self.children.append({})
+            self.untried.append(untried)
+            self.visits.append(0)
+            self.wins.append(0.0)
+            self.states.append(state)
+        return node
+
+    def _recycle(self, keep):
+        # Puts every node of the old tree outside the keep subtree on the free list
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node == keep:
+                continue
+            stack.extend(self.children[node].values())
+            self.children[node] = {}
+            self.untried[node] = []
+            self.free.append(node)
+
+    def _find(self, current, mask):
+        # The node of (current, mask) when it is the root or one or two moves below it
+        column_of = self.geometry.column_of
+        old_current, old_mask = self.root_position
+        new_cells = mask ^ old_mask
+        count = new_cells.bit_count()
+        if old_mask & ~mask:
+            return None
+        if count == 0 and current == old_current:
+            return self.root
+        if count == 1 and current == old_current ^ old_mask:
+            return self.children[self.root].get(column_of(new_cells))
+        if count == 2 and (current & old_mask) == old_current:
+            # The root side played the new cell in current, then the opponent
+            own_cell = new_cells & current
+            reply_cell = new_cells & ~current
+            child = self.children[self.root].get(column_of(own_cell))
+            if child is not None:
+                return self.children[child].get(column_of(reply_cell))
+        return None
+
+    def set_position(self, current, mask):
+        """Moves the root to (current, mask), reusing the tree when possible.
+
+        The tree is kept when the new position is the root or one or two
+        moves below it, otherwise it is recycled and a new root is made.
+        Symmetric nodes only expand the moves on one side, so a move on the
+        other side is found as its mirror image, and from then on the tree
+        holds the mirror image of the game.
+        """
+        keep = None
+        if self.root is not None:
+            mirror = self.geometry.mirror
+            if self.mirrored:
+                current, mask = mirror(current), mirror(mask)
+            keep = self._find(current, mask)
+            if keep is None:
+                keep = self._find(mirror(current), mirror(mask))
+                if keep is not None:
+                    current, mask = mirror(current), mirror(mask)
+                    self.mirrored = not self.mirrored
+                elif self.mirrored:
+                    current, mask = mirror(current), mirror(mask)
+            if keep != self.root:
+                self._recycle(keep)
+        if keep is None:
+            keep = self._new_node(None, current, mask)
+            self.mirrored = False
+        self.root = keep
+        self.root_position = (current, mask)
+
+    def _iterate(self):
+        node = self.root
+        current, mask = self.root_position
+        path = [node]
+        # Selection
+        while not self.untried[node] and self.children[node]:
+            log_visits = math.log(self.visits[node])
+            best, best_value = None, -1.0
+            for child in self.children[node].values():
+                value = (self.wins[child] / self.visits[child]
+                         + self.exploration * math.sqrt(log_visits / self.visits[child]))
+                if value > best_value:
+                    best, best_value = child, value
+            node = best
+            current, mask = _play(current, mask, self.moves[node], self.geometry)
+            path.append(node)
+        # Expansion
+        state = self.states[node]
+        if state == _OPEN and self.untried[node] and len(self) < self.max_nodes:
+            col = self.untried[node].pop()
+            current, mask = _play(current, mask, col, self.geometry)
+            child = self._new_node(col, current, mask)
+            self.children[node][col] = child
+            node = child
+            state = self.states[node]
+            path.append(node)
+        # Simulation, from the point of view of the side that played into node
+        if state == _WIN:
+            result = 1.0
+        elif state == _DRAW:
+            result = 0.5
+        else:
+            result = 1.0 - rollout(current, mask, self.rng, self.geometry)
+        # Backpropagation, alternating sides
+        for node in reversed(path):
+            self.visits[node] += 1
+            self.wins[node] += result
+            result = 1.0 - result
+
+    def search(self, iterations=None, time_budget=None, stop=None, progress=None):
+        # Runs iterations or until time_budget seconds pass, DEFAULT_ITERATIONS
+        # when neither is given, and stops early when the stop event is set.
+        # progress(iterations, column, score) is called every 1024 iterations.
+        if iterations is None and time_budget is None:
+            iterations = DEFAULT_ITERATIONS
+        deadline = None if time_budget is None else time.time() + time_budget
+        done = 0
+        while iterations is None or done < iterations:
+            # At least one iteration, so the root has a move to return
+            if done and not done & 63:
+                if deadline is not None and time.time() > deadline:
+                    break
+                if stop is not None and stop.is_set():
+                    break
+                if progress is not None and not done & 1023:
+                    column, score = self.best_move()
+                    progress(done, column, score)
+            self._iterate()
+            done += 1
+        return done
+
+    def best_move(self):
+        # The most visited move is the most robust choice, with its win chance in percent
+        stats = self.root_stats()
+        column = max(stats, key=lambda col: stats[col][0])
+        visits, wins = stats[column]
+        return column, round(100 * wins / visits, 1)
+
+    def root_stats(self):
+        # {column: (visits, wins of the side to move)} at the root, columns of the position searched
+        last = self.geometry.columns - 1 if self.mirrored else None
+        return {col if last is None else last - col: (self.visits[child], self.wins[child])
+                for col, child in self.children[self.root].items()}
+
+    def tree_depth(self):
+        depth, frontier = 0, [self.root]
+        while True:
+            frontier = [child for node in frontier for child in self.children[node].values()]
+            if not frontier:
+                return depth
+            depth += 1
+
+
+def _search_worker(current, mask, iterations, time_budget, max_nodes, seed, shape):
+    engine = MCTS(max_nodes=max_nodes, seed=seed, geometry=make_geometry(*shape))
+    engine.set_position(current, mask)
+    engine.search(iterations, time_budget)
+    return engine.root_stats()
+
+
+def mcts_move(board, piece, engine=None, iterations=None, time_budget=None, workers=1, executor=None, stop=None,
+              progress=None, count_reused=False):
+    """Column, score and info for piece to move on an array board.
+
+    score is the estimated chance in percent that piece wins after the
+    column, and info["move_scores"] has that chance for every column tried.
+    With workers > 1 that many independent trees are searched at once, the
+    local one plus workers - 1 in worker processes, and their root
+    statistics are added up. Pass the same engine every move to reuse the tree.
+    stop and progress are passed on to MCTS.search for the local tree. An
+    array board is read with the geometry of the engine. With count_reused the
+    visits the root already has count towards iterations, so a tree grown
+    while the opponent thought (see ponder.py) answers sooner.
+    """
+    start_time = time.time()
+    if engine is None:
+        engine = MCTS(geometry=board.geometry if isinstance(board, Position) else STANDARD)
+    position = board if isinstance(board, Position) else engine.geometry.position_class.from_array(board)
+    current, mask = position.bitboards[piece], position.mask()
+    engine.set_position(current, mask)
+    reused = engine.visits[engine.root]
+    if count_reused and iterations is not None:
+        iterations = max(1, iterations - reused)
+
+    futures = []
+    own_executor = None
+    if workers > 1:
+        if executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            executor = own_executor = ProcessPoolExecutor(max_workers=workers - 1)
+        futures = [executor.submit(_search_worker, current, mask, iterations, time_budget, engine.max_nodes,
+                                   engine.rng.random(), engine.geometry.shape()) for _ in range(workers - 1)]
+    try:
+        done = engine.search(iterations, time_budget, stop, progress)
+        stats = engine.root_stats()
+        for future in futures:
+            for col, (visits, wins) in future.result().items():
+                old_visits, old_wins = stats.get(col, (0, 0.0))
+                stats[col] = (old_visits + visits, old_wins + wins)
+    finally:
+        if own_executor is not None:
+            own_executor.shutdown()
+
+    # The most visited move is the most robust choice
+    column = max(stats, key=lambda col: stats[col][0])
+    visits, wins = stats[column]
+    return column, round(100 * wins / visits, 1), {
+        "depth": engine.tree_depth(),
+        "nodes": done * max(1, workers),
+        "allocations": len(engine),
+        "nodes_per_depth": [],
+        "branching_factors": [],
+        "elapsed": time.time() - start_time,
+        "book": False,
+        "reused_visits": reused,
+        "root_visits": {col: stats[col][0] for col in sorted(stats)},
+        "move_scores": {col: round(100 * stats[col][1] / stats[col][0], 1) for col in sorted(stats)},
+    }
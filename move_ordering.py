@@ -0,0 +1,61 @@
+"""Move ordering for the alpha-beta search.
+
+Alpha-beta prunes the most when the best move is searched first. Moves are
+tried in this order: the transposition table move, the killer moves of the
+ply, then moves by history score, and center columns first among equals.
+Each heuristic can be switched off to measure what it prunes.
+"""
+from bitboard import COLUMN_COUNT, STANDARD
+
+
+def center_order(columns):
+    # Columns from the center outwards
+    return sorted(range(columns), key=lambda c: abs(c - columns // 2))
+
+
+CENTER_ORDER = center_order(COLUMN_COUNT)
+
+_HASH_BONUS = 1 << 40
+_KILLER_BONUS = 1 << 38
+
+
+class MoveOrdering:
+    def __init__(self, center_first=True, killers=True, history=True, hash_move=True, geometry=STANDARD):
+        self.center_first = center_first
+        self.use_killers = killers
+        self.use_history = history
+        self.use_hash_move = hash_move
+        self.columns = geometry.columns
+        order = center_order(geometry.columns)
+        self.center_rank = [order.index(c) for c in range(geometry.columns)]
+        self.killers = {}  # ply -> the last two moves that caused a cutoff there
+        self.history = [[0] * (geometry.columns * geometry.h1) for _ in range(3)]  # [piece][cell]
+
+    def order(self, position, moves, ply, piece, hash_move=None):
+        killers = self.killers.get(ply, ()) if self.use_killers else ()
+        history = self.history[piece]
+        heights = position.heights
+        columns, center_rank = self.columns, self.center_rank
+
+        def priority(col):
+            score = 0
+            if col == hash_move and self.use_hash_move:
+                score += _HASH_BONUS
+            if col in killers:
+                score += _KILLER_BONUS >> killers.index(col)
+            if self.use_history:
+                score += history[heights[col]] * columns
+            if self.center_first:
+                score += columns - center_rank[col]
+            return score
+
+        return sorted(moves, key=priority, reverse=True)
+
+    def record_cutoff(self, position, ply, piece, col, depth):
+        if self.use_killers:
+            killers = self.killers.setdefault(ply, [])
+            if col not in killers:
+                killers.insert(0, col)
+                del killers[2:]
+        if self.use_history:
+            self.history[piece][position.heights[col]] += depth * depth
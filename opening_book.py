@@ -0,0 +1,179 @@
+"""Precomputed opening book, memory-mapped at runtime.
+
+The build step searches every position reachable in the first --plies moves
+and writes a binary file: a small header, the sorted position keys as
+uint64 and one packed int32 per key holding the best move and its score.
+At runtime the file is memory-mapped and looked up with a binary search, so
+a lookup costs microseconds and every process that opens the same book
+shares its pages through the OS page cache instead of loading a copy.
+Mirror images are stored once, under the canonical key (see
+Position.canonical_key), which about halves the book; the move is mirrored
+back when the position looked up is the other image.
+
+    python opening_book.py --plies 8 --depth 8 --output opening_book.bin
+"""
+import argparse
+import functools
+import os
+import struct
+import sys
+import time
+
+from bitboard import COLUMN_COUNT, Position
+from evaluation import AI_PLAYER, HUMAN_PLAYER
+from search import AI_WIN_SCORE, HUMAN_WIN_SCORE, iterative_deepening
+from transposition import TranspositionTable
+
+MAGIC = b"C4BK"
+VERSION = 1
+# magic, version, entry count, plies covered, search depth
+_HEADER = struct.Struct("<4sIQII")
+
+# Values pack the score above the 3 move bits, won games get their own codes
+_MOVE_BITS = 3
+_AI_WIN_CODE = (1 << 27) - 1
+_HUMAN_WIN_CODE = -(1 << 27)
+
+DEFAULT_BOOK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.bin")
+
+
+def _pack(move, score):
+    if score == AI_WIN_SCORE:
+        code = _AI_WIN_CODE
+    elif score == HUMAN_WIN_SCORE:
+        code = _HUMAN_WIN_CODE
+    else:
+        code = max(_HUMAN_WIN_CODE + 1, min(_AI_WIN_CODE - 1, int(score)))
+    return (code << _MOVE_BITS) | move
+
+
+def _unpack(value):
+    value = int(value)
+    code = value >> _MOVE_BITS
+    if code == _AI_WIN_CODE:
+        code = AI_WIN_SCORE
+    elif code == _HUMAN_WIN_CODE:
+        code = HUMAN_WIN_SCORE
+    return value & ((1 << _MOVE_BITS) - 1), code
+
+
+def side_to_move(position):
+    # Books assume the usual order, HUMAN_PLAYER's pieces go first
+    return AI_PLAYER if position.mask().bit_count() % 2 else HUMAN_PLAYER
+
+
+class OpeningBook:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            magic, version, count, plies, depth = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} opening book")
+        import numpy as np
+        self.path = path
+        self.plies = plies
+        self.depth = depth
+        self.keys = np.memmap(path, dtype="<u8", mode="r", offset=_HEADER.size, shape=(count,))
+        self.values = np.memmap(path, dtype="<i4", mode="r", offset=_HEADER.size + 8 * count, shape=(count,))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def probe(self, position):
+        # Returns (move, score) for the side to move, or None
+        import numpy as np
+        key, mirrored = position.canonical_key()
+        key = np.uint64(key)
+        i = int(np.searchsorted(self.keys, key))
+        if i < len(self.keys) and self.keys[i] == key:
+            move, score = _unpack(self.values[i])
+            return (COLUMN_COUNT - 1 - move if mirrored else move), score
+        return None
+
+    def lookup(self, position, maximizingPlayer):
+        # Only answers for the side the book was built for
+        if (side_to_move(position) == AI_PLAYER) != bool(maximizingPlayer):
+            return None
+        return self.probe(position)
+
+
+@functools.lru_cache(maxsize=None)
+def open_book(path=DEFAULT_BOOK):
+    # One mapping per path and process, None when there is no book file
+    if not os.path.exists(path):
+        return None
+    return OpeningBook(path)
+
+
+def book_positions(plies):
+    # Every position reachable in up to plies moves where the game goes on,
+    # one image of each mirrored pair, keyed by its canonical key
+    positions = {}
+    frontier = [Position()]
+    for ply in range(plies + 1):
+        next_frontier = []
+        for position in frontier:
+            key, mirrored = position.canonical_key()
+            if key in positions:
+                continue
+            if mirrored:
+                position = position.mirrored()
+            positions[key] = position
+            if ply == plies:
+                continue
+            piece = HUMAN_PLAYER if ply % 2 == 0 else AI_PLAYER
+            for col in position.valid_moves():
+                child = position.copy()
+                child.play(col, piece)
+                if not child.is_win(piece):
+                    next_frontier.append(child)
+        frontier = next_frontier
+    return positions
+
+
+# Every build worker reuses one table for all the positions it searches
+_worker_tt = None
+
+
+def _search_position(args):
+    global _worker_tt
+    if _worker_tt is None:
+        _worker_tt = TranspositionTable()
+    board, maximizing, depth = args
+    col, score, _ = iterative_deepening(board, maximizing, max_depth=depth, use_alpha_beta=True, tt=_worker_tt)
+    return int(col), score
+
+
+def build_book(path, plies, depth, workers=None):
+    from concurrent.futures import ProcessPoolExecutor
+
+    import numpy as np
+
+    positions = book_positions(plies)
+    keys = sorted(positions)
+    jobs = [(positions[key].to_array(), side_to_move(positions[key]) == AI_PLAYER, depth) for key in keys]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_search_position, jobs, chunksize=64))
+
+    values = np.array([_pack(move, score) for move, score in results], dtype="<i4")
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(keys), plies, depth))
+        f.write(np.array(keys, dtype="<u8").tobytes())
+        f.write(values.tobytes())
+    return len(keys)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the opening book.")
+    parser.add_argument("--plies", type=int, default=6, help="cover every position up to this many moves")
+    parser.add_argument("--depth", type=int, default=8, help="search depth for every book position")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default=DEFAULT_BOOK)
+    args = parser.parse_args(argv)
+
+    start_time = time.time()
+    count = build_book(args.output, args.plies, args.depth, args.workers)
+    print(f"{count} positions written to {args.output} in {time.time() - start_time:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
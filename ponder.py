@@ -0,0 +1,126 @@
+"""Pondering: searching on the opponent's time.
+
+While the opponent thinks, Ponderer searches the position after each of
+its likely replies, one after the other, with the same search the real move
+will use. When the opponent plays, a reply that was searched to the end
+answers at once, a search still running on the reply played simply goes on,
+and any other search is stopped and its result dropped. The searches share
+the game's transposition table (or solver table), so even a miss leaves
+useful entries behind. MCTS ponders differently, ponder_tree grows the tree
+below the current position and the next move reuses it.
+
+Nothing here allocates beyond a result per reply: memory stays within the
+fixed size of the shared tables and the node cap of the MCTS tree. All
+pondering runs on the game's single worker thread, so it never searches at
+the same time as a real move.
+"""
+import threading
+
+from bitboard import STANDARD
+from move_ordering import center_order
+from search import table_key
+
+
+def likely_replies(board, piece, tt=None, maximizing=None, geometry=STANDARD):
+    # Columns piece may play on board, the move the last search expected first
+    position = geometry.position_class.from_array(board)
+    replies = [col for col in center_order(geometry.columns) if position.can_play(col)]
+    if tt is not None and maximizing is not None:
+        key, mirrored = table_key(position)
+        entry = tt.probe(key * 2 + maximizing)
+        expected = None if entry is None else entry[3]
+        if expected is not None and mirrored:
+            expected = geometry.columns - 1 - expected
+        if expected in replies:
+            replies.remove(expected)
+            replies.insert(0, expected)
+    return replies
+
+
+class Ponderer:
+    """Searches the replies of the opponent in turn until it moves.
+
+    search(board, stop) must return (column, score, info) for the pondering
+    side on board and end early when the stop event is set.
+    """
+
+    def __init__(self, search):
+        self.search = search
+        self.lock = threading.Lock()
+        self.results = {}  # reply -> (column, score, info) of a search that ran to the end
+        self.current = None  # (reply, stop event) of the running search
+        self.played = None  # the reply the opponent played, None while it thinks
+        self.hits = 0
+        self.misses = 0
+
+    def submit(self, executor, board, piece, replies):
+        """Starts pondering on board, where piece is about to play one of replies.
+
+        The searches run on executor and end once every reply is searched,
+        the opponent has played or cancel() was called. Returns the future.
+        """
+        with self.lock:
+            self.results = {}
+            self.played = None
+        return executor.submit(self._run, board.copy(), piece, replies)
+
+    def _run(self, board, piece, replies):
+        for reply in replies:
+            stop = threading.Event()
+            with self.lock:
+                # Nothing new starts once the opponent has played
+                if self.played is not None:
+                    break
+                self.current = (reply, stop)
+            child = board.copy()
+            child[int((child[:, reply] != 0).sum())][reply] = piece
+            result = self.search(child, stop)
+            with self.lock:
+                self.current = None
+                # A stopped search is only kept when it is the reply played
+                if not stop.is_set() or reply == self.played:
+                    self.results[reply] = result
+
+    def play(self, reply):
+        # The opponent played reply, stops the search unless it is on that reply
+        with self.lock:
+            self.played = reply
+            if reply in self.results:
+                self.hits += 1
+            elif self.current is not None and self.current[0] == reply:
+                self.hits += 1
+            else:
+                self.misses += 1
+                if self.current is not None:
+                    self.current[1].set()
+
+    def has_result(self, reply):
+        with self.lock:
+            return reply in self.results
+
+    def result(self, reply):
+        # The finished search of reply, or None; call once pondering has ended
+        with self.lock:
+            return self.results.get(reply)
+
+    def cancel(self):
+        # Ends pondering, a search of the reply already played still keeps its result
+        with self.lock:
+            if self.played is None:
+                self.played = -1
+            if self.current is not None:
+                self.current[1].set()
+
+
+def ponder_tree(engine, current, mask, stop, chunk=1024):
+    """Grows the MCTS tree of engine below (current, mask) until stop is set.
+
+    (current, mask) is the position with the opponent to move. Stops by itself
+    once the tree has max_nodes nodes, more rollouts would only refine the
+    statistics the next move already has.
+    """
+    engine.set_position(current, mask)
+    done = 0
+    while not stop.is_set() and len(engine) < engine.max_nodes:
+        done += engine.search(chunk, stop=stop)
+    return done
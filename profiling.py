@@ -0,0 +1,57 @@
+"""Per-move search statistics and profiles for the game, off by default.
+
+Two environment variables switch them on without touching the code:
+
+    CONNECT4_STATS=moves.jsonl   append the search statistics of every AI move as a JSON line
+    CONNECT4_PROFILE=profiles    write a cProfile file for every AI move into this directory
+
+The profiles open with ``python -m pstats profiles/move001.prof`` or any
+viewer that reads cProfile output. When neither is set measure() and
+record() return at once, so the game pays nothing for the hooks.
+"""
+import contextlib
+import cProfile
+import json
+import os
+import time
+
+
+class MoveProfiler:
+    def __init__(self, stats_path=None, profile_dir=None):
+        self.stats_path = stats_path
+        self.profile_dir = profile_dir
+        self.moves = 0
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        return cls(environ.get("CONNECT4_STATS") or None, environ.get("CONNECT4_PROFILE") or None)
+
+    @property
+    def timing(self):
+        # Per-part timers are only worth their cost when someone reads them
+        return self.stats_path is not None
+
+    @contextlib.contextmanager
+    def measure(self):
+        # Wraps the search of one move
+        self.moves += 1
+        if self.profile_dir is None:
+            yield
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profiler.dump_stats(os.path.join(self.profile_dir, f"move{self.moves:03d}.prof"))
+
+    def record(self, column, score, info, **fields):
+        if self.stats_path is None:
+            return
+        record = dict(fields, move=self.moves, time=time.time(), column=int(column), score=float(score),
+                      depth=info.get("depth"), elapsed=round(info.get("elapsed", 0.0), 6), book=info.get("book"),
+                      stats=info.get("stats"))
+        with open(self.stats_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
@@ -0,0 +1,551 @@
+"""Minimax search over bitboard positions.
+
+minimax keeps the call signature the game has always used, and also takes
+the optional helpers that make it fast: search statistics and budgets, a
+transposition table, move ordering, principal variation search and threat
+pruning. iterative_deepening drives it under a time or node budget.
+
+A position and its mirror image share one transposition table entry, and a
+symmetric position only searches the moves on one side of the board. Mirror
+images only meet in the opening, so positions of MIRROR_PLIES stones or
+more skip the check and keep their own key.
+"""
+import functools
+import itertools
+import math
+import time
+
+from bitboard import STANDARD, Position
+from evaluation import AI_PLAYER, HUMAN_PLAYER, EvaluatedPosition, evaluated_position_class
+from move_ordering import MoveOrdering
+from transposition import EXACT, LOWER, UPPER, TranspositionTable
+
+AI_WIN_SCORE = 100000000000000
+HUMAN_WIN_SCORE = -10000000000000
+MIRROR_PLIES = 12
+BOUND_NAMES = {EXACT: "exact", LOWER: "lower", UPPER: "upper"}
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchStats:
+    def __init__(self, deadline=None, node_limit=None, timing=False, stop=None):
+        self.nodes = 0
+        self.allocations = 0  # boards created while searching
+        self.deadline = deadline
+        self.node_limit = node_limit
+        self.stop = stop  # a threading.Event that ends the search when set
+        # Moves the threat shortcuts took out of the search, by shortcut
+        self.pruned = {"immediate_win": 0, "forced_block": 0, "double_threat": 0, "under_threat": 0}
+        self.nodes_per_depth = []
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0  # cutoffs by the first move searched
+        self.tt_hits = 0
+        self.leaf_evaluations = 0
+        # Seconds per part of the search, only measured with timing=True
+        # because the clock calls cost more than the work they measure
+        self.timers = {"evaluation": 0.0, "move_generation": 0.0, "win_checks": 0.0} if timing else None
+
+    def check_budget(self):
+        if self.deadline is not None and time.time() > self.deadline:
+            raise SearchTimeout()
+        if self.node_limit is not None and self.nodes > self.node_limit:
+            raise SearchTimeout()
+        if self.stop is not None and self.stop.is_set():
+            raise SearchTimeout()
+
+    def first_move_cutoff_rate(self):
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def as_dict(self):
+        stats = {
+            "nodes": self.nodes,
+            "nodes_per_depth": list(self.nodes_per_depth),
+            "cutoffs": self.cutoffs,
+            "first_move_cutoff_rate": round(self.first_move_cutoff_rate(), 4),
+            "tt_hits": self.tt_hits,
+            "leaf_evaluations": self.leaf_evaluations,
+            "allocations": self.allocations,
+            "pruned": dict(self.pruned),
+        }
+        if self.timers is not None:
+            stats["seconds"] = {name: round(seconds, 6) for name, seconds in self.timers.items()}
+        return stats
+
+
+class TimedPosition(EvaluatedPosition):
+    # Adds the time spent making and unmaking moves, which is where the
+    # incremental evaluation happens, to timers["evaluation"]
+
+    __slots__ = ("timers",)
+
+    def play(self, col, piece):
+        start = time.perf_counter()
+        EvaluatedPosition.play(self, col, piece)
+        self.timers["evaluation"] += time.perf_counter() - start
+
+    def undo(self):
+        start = time.perf_counter()
+        col = EvaluatedPosition.undo(self)
+        self.timers["evaluation"] += time.perf_counter() - start
+        return col
+
+
+def table_key(position):
+    # The key minimax stores position under, and whether it is the mirror image's
+    if position.mask().bit_count() < MIRROR_PLIES:
+        return position.canonical_key()
+    return position.key(), False
+
+
+def minimax(board, depth, maximizingPlayer, alpha=-math.inf, beta=math.inf, use_alpha_beta=False, stats=None,
+            tt=None, ordering=None, use_pvs=False, use_threats=False, root_scores=None, multi_pv=False):
+    # The search makes and unmakes moves on one shared bitboard that keeps its
+    # own evaluation up to date, array boards are converted once at the root.
+    # Given a dict, root_scores gets (score, bound) for every move of this node,
+    # searched with the full window: bound is EXACT, or with alpha-beta UPPER or
+    # LOWER when the move could only be shown worse or better than the best.
+    # multi_pv searches every move of this node with the full window, so that
+    # all of their scores are exact, at the price of the pruning between them.
+    # A plain Position is taken over without going through an array board.
+    if not isinstance(board, EvaluatedPosition):
+        if isinstance(board, Position):
+            board = evaluated_position_class(board.geometry).from_position(board)
+        else:
+            board = EvaluatedPosition.from_array(board)
+        if stats is not None:
+            stats.allocations += 1
+    position = board
+    timers = None
+    if stats is not None:
+        stats.nodes += 1
+        if not stats.nodes & 255:
+            stats.check_budget()
+        timers = stats.timers
+        if timers is not None:
+            start = time.perf_counter()
+
+    ai_wins = position.is_win(AI_PLAYER)
+    human_wins = position.is_win(HUMAN_PLAYER)
+    if timers is not None:
+        timers["win_checks"] += time.perf_counter() - start
+        start = time.perf_counter()
+    valid_locations = position.valid_moves()
+    if timers is not None:
+        timers["move_generation"] += time.perf_counter() - start
+    is_terminal = ai_wins or human_wins or len(valid_locations) == 0
+
+    if is_terminal:
+        if ai_wins:
+            return (None, AI_WIN_SCORE)
+        elif human_wins:
+            return (None, HUMAN_WIN_SCORE)
+        else:  # Game is over, no more valid moves
+            return (None, 0)
+
+    geometry = position.geometry
+
+    # Threat pruning: win at once when possible, block a single threat and
+    # never play right under a cell where the opponent would win
+    if use_threats and depth > 0:
+        if timers is not None:
+            start = time.perf_counter()
+        piece = AI_PLAYER if maximizingPlayer else HUMAN_PLAYER
+        win_score = AI_WIN_SCORE if maximizingPlayer else HUMAN_WIN_SCORE
+        loss_score = HUMAN_WIN_SCORE if maximizingPlayer else AI_WIN_SCORE
+        mask = position.mask()
+        playable = geometry.playable_cells(mask)
+        wins = geometry.winning_cells(position.bitboards[piece], mask) & playable
+        if wins:
+            if stats is not None:
+                stats.pruned["immediate_win"] += len(valid_locations) - 1
+            if root_scores is not None:
+                root_scores[geometry.column_of(wins)] = (win_score, EXACT)
+            return geometry.column_of(wins), win_score
+        threats = geometry.winning_cells(position.bitboards[AI_PLAYER + HUMAN_PLAYER - piece], mask)
+        forced = threats & playable
+        if root_scores is not None:
+            # Every move the shortcuts below leave out lets the opponent win at once
+            root_scores.update((col, (loss_score, EXACT)) for col in valid_locations)
+        if timers is not None:
+            timers["win_checks"] += time.perf_counter() - start
+        if forced & (forced - 1):
+            # Two threats at once, the opponent wins whichever is blocked
+            if stats is not None:
+                stats.pruned["double_threat"] += len(valid_locations) - 1
+            return geometry.column_of(forced), loss_score
+        if forced:
+            if stats is not None:
+                stats.pruned["forced_block"] += len(valid_locations) - 1
+            valid_locations = [geometry.column_of(forced)]
+        else:
+            heights = position.heights
+            safe = [col for col in valid_locations if not (threats >> heights[col]) & 2]
+            if not safe:
+                # Every move lets the opponent win on top of it
+                if stats is not None:
+                    stats.pruned["under_threat"] += len(valid_locations) - 1
+                return valid_locations[0], loss_score
+            if stats is not None:
+                stats.pruned["under_threat"] += len(valid_locations) - len(safe)
+            valid_locations = safe
+
+    # In the opening a symmetric position only needs the moves on one side, and
+    # the table key is the smaller of its key and its mirror image's, see table_key
+    last_column = geometry.columns - 1
+    key = position.key()
+    mirrored = symmetric = False
+    if position.mask().bit_count() < MIRROR_PLIES:
+        mirror_key = geometry.mirror(key)
+        symmetric = mirror_key == key
+        if symmetric:
+            valid_locations = [col for col in valid_locations if 2 * col <= last_column]
+        elif mirror_key < key:
+            key, mirrored = mirror_key, True
+
+    # Look the position up before searching it again, the move is stored
+    # mirrored under the key of the mirror image
+    hash_move = None
+    if tt is not None:
+        tt_key = key * 2 + maximizingPlayer
+        entry = tt.probe(tt_key)
+        if entry is not None:
+            if stats is not None:
+                stats.tt_hits += 1
+            entry_depth, entry_score, flag, hash_move = entry
+            if mirrored and hash_move is not None:
+                hash_move = last_column - hash_move
+            if root_scores is None and entry_depth >= depth and (flag == EXACT or (use_alpha_beta and (
+                    flag == LOWER and entry_score >= beta or flag == UPPER and entry_score <= alpha))):
+                return hash_move, entry_score
+
+    if depth == 0:
+        if stats is not None:
+            stats.leaf_evaluations += 1
+        value = position.score
+        if tt is not None:
+            tt.store(tt_key, 0, value, EXACT, None)
+        return (None, value)
+
+    # Otherwise try the best move of the shallower search first
+    ply = len(position.moves)
+    if timers is not None:
+        start = time.perf_counter()
+    if ordering is not None:
+        valid_locations = ordering.order(position, valid_locations, ply,
+                                         AI_PLAYER if maximizingPlayer else HUMAN_PLAYER, hash_move)
+    elif hash_move is not None:
+        valid_locations.remove(hash_move)
+        valid_locations.insert(0, hash_move)
+    if timers is not None:
+        timers["move_generation"] += time.perf_counter() - start
+
+    # With PVS every move after the first is searched with a null window
+    # first, and only searched again if it might beat the best move so far
+    pvs = use_pvs and use_alpha_beta
+    alpha_orig, beta_orig = alpha, beta
+    if maximizingPlayer:
+        value = -math.inf
+        column = valid_locations[0]
+        for i, col in enumerate(valid_locations):
+            position.play(col, AI_PLAYER)
+            if multi_pv:
+                new_score = minimax(position, depth - 1, False, alpha_orig, beta, use_alpha_beta, stats, tt,
+                                    ordering, use_pvs, use_threats)[1]
+            elif pvs and i > 0:
+                new_score = minimax(position, depth - 1, False, alpha, alpha + 1, use_alpha_beta, stats, tt,
+                                    ordering, use_pvs, use_threats)[1]
+                if alpha < new_score < beta:
+                    new_score = minimax(position, depth - 1, False, alpha, beta, use_alpha_beta, stats, tt,
+                                        ordering, use_pvs, use_threats)[1]
+            else:
+                new_score = minimax(position, depth - 1, False, alpha, beta, use_alpha_beta, stats, tt,
+                                    ordering, use_pvs, use_threats)[1]
+            position.undo()
+            if root_scores is not None:
+                root_scores[col] = (new_score, _bound(new_score, alpha_orig if multi_pv else alpha, beta,
+                                                      use_alpha_beta))
+            if new_score > value:
+                value = new_score
+                column = col
+            if use_alpha_beta:
+                alpha = max(alpha, value)
+                if alpha >= beta:
+                    if stats is not None:
+                        stats.cutoffs += 1
+                        stats.first_move_cutoffs += i == 0
+                    if ordering is not None:
+                        ordering.record_cutoff(position, ply, AI_PLAYER, col, depth)
+                    break
+    else:  # Minimizing player
+        value = math.inf
+        column = valid_locations[0]
+        for i, col in enumerate(valid_locations):
+            position.play(col, HUMAN_PLAYER)
+            if multi_pv:
+                new_score = minimax(position, depth - 1, True, alpha, beta_orig, use_alpha_beta, stats, tt,
+                                    ordering, use_pvs, use_threats)[1]
+            elif pvs and i > 0:
+                new_score = minimax(position, depth - 1, True, beta - 1, beta, use_alpha_beta, stats, tt,
+                                    ordering, use_pvs, use_threats)[1]
+                if alpha < new_score < beta:
+                    new_score = minimax(position, depth - 1, True, alpha, beta, use_alpha_beta, stats, tt,
+                                        ordering, use_pvs, use_threats)[1]
+            else:
+                new_score = minimax(position, depth - 1, True, alpha, beta, use_alpha_beta, stats, tt,
+                                    ordering, use_pvs, use_threats)[1]
+            position.undo()
+            if root_scores is not None:
+                root_scores[col] = (new_score, _bound(new_score, alpha, beta_orig if multi_pv else beta,
+                                                      use_alpha_beta))
+            if new_score < value:
+                value = new_score
+                column = col
+            if use_alpha_beta:
+                beta = min(beta, value)
+                if alpha >= beta:
+                    if stats is not None:
+                        stats.cutoffs += 1
+                        stats.first_move_cutoffs += i == 0
+                    if ordering is not None:
+                        ordering.record_cutoff(position, ply, HUMAN_PLAYER, col, depth)
+                    break
+
+    if tt is not None:
+        if use_alpha_beta and value <= alpha_orig:
+            flag = UPPER
+        elif use_alpha_beta and value >= beta_orig:
+            flag = LOWER
+        else:
+            flag = EXACT
+        tt.store(tt_key, depth, value, flag, last_column - int(column) if mirrored else int(column))
+    if root_scores is not None and symmetric:
+        # The moves left out score like their mirror images
+        for col in list(root_scores):
+            root_scores[last_column - col] = root_scores[col]
+    return column, value
+
+
+def _bound(score, alpha, beta, use_alpha_beta):
+    # What a score searched with the window (alpha, beta) tells about the move
+    if use_alpha_beta and score <= alpha:
+        return UPPER
+    if use_alpha_beta and score >= beta:
+        return LOWER
+    return EXACT
+
+
+def principal_variation(position, tt, maximizingPlayer, length):
+    # The line of play the table expects from position, up to length moves
+    line = []
+    for _ in range(length):
+        key, mirrored = table_key(position)
+        entry = tt.probe(key * 2 + maximizingPlayer)
+        if entry is None or entry[3] is None:
+            break
+        col = position.geometry.columns - 1 - entry[3] if mirrored else entry[3]
+        if not position.can_play(col):
+            break
+        piece = AI_PLAYER if maximizingPlayer else HUMAN_PLAYER
+        position.play(col, piece)
+        line.append(col)
+        if position.is_win(piece):
+            break
+        maximizingPlayer = not maximizingPlayer
+    for _ in line:
+        position.undo()
+    return line
+
+
+@functools.lru_cache(maxsize=None)
+def _timed_position_class(geometry):
+    if geometry == STANDARD:
+        return TimedPosition
+    return type(f"TimedPosition{geometry.rows}x{geometry.columns}x{geometry.connect}",
+                (TimedPosition, evaluated_position_class(geometry)), {"__slots__": ()})
+
+
+def iterative_deepening(board, maximizingPlayer, max_depth=None, time_budget=None, node_budget=None,
+                        use_alpha_beta=False, tt=None, ordering=None, use_pvs=False, book=None, use_threats=False,
+                        timing=False, stop=None, progress=None, geometry=STANDARD, multi_pv=False):
+    # Searches depth 1, 2, 3... until the budget runs out and returns the move
+    # of the last depth that finished. The transposition table carries the
+    # best move of every searched position over to the next iteration, where
+    # it is tried first. An opening book built at least max_depth deep
+    # answers before any search. info["stats"] has the SearchStats of the
+    # search, with the time per part of the search when timing is on.
+    # Setting the stop event ends the search early like the time budget
+    # does, and progress(depth, column, score) is called after every depth.
+    # board may have the size of another geometry, books only cover the standard one.
+    # board may also be a Position of geometry, which needs no NumPy at all.
+    # info["move_scores"] has the score of every move from the last depth that
+    # finished, info["move_bounds"] whether each is "exact" or an "upper" or
+    # "lower" bound (all exact with multi_pv, see minimax), and info["pv"] the
+    # principal variation. A book answer has neither.
+    start_time = time.time()
+    stats = SearchStats(timing=timing)
+    position_class = _timed_position_class(geometry) if timing else evaluated_position_class(geometry)
+    if isinstance(board, Position):
+        position = position_class.from_position(board)
+    else:
+        position = position_class.from_array(board)
+    if timing:
+        position.timers = stats.timers
+    if book is not None and geometry == STANDARD and (max_depth is None or book.depth >= max_depth):
+        hit = book.lookup(position, maximizingPlayer)
+        if hit is not None:
+            column, score = hit
+            return column, score, {
+                "depth": book.depth,
+                "nodes": 0,
+                "allocations": 0,
+                "nodes_per_depth": [],
+                "branching_factors": [],
+                "elapsed": time.time() - start_time,
+                "book": True,
+            }
+    empty_cells = geometry.cells - position.mask().bit_count()
+    max_depth = empty_cells if max_depth is None else min(max_depth, empty_cells)
+    if tt is None:
+        tt = TranspositionTable.for_depth(max_depth, geometry.columns)
+    tt.new_search()
+    if ordering is None and use_alpha_beta:
+        ordering = MoveOrdering(geometry=geometry)
+
+    # The first iteration always finishes so there is a move to return
+    move_scores = {}
+    column, score = minimax(position, 1, maximizingPlayer, use_alpha_beta=use_alpha_beta, stats=stats, tt=tt,
+                            ordering=ordering, use_pvs=use_pvs, use_threats=use_threats, root_scores=move_scores,
+                            multi_pv=multi_pv)
+    depth_reached = 1
+    nodes_per_depth = stats.nodes_per_depth
+    nodes_per_depth.append(stats.nodes)
+    if progress is not None:
+        progress(1, column, score)
+
+    if time_budget is not None:
+        stats.deadline = start_time + time_budget
+    stats.node_limit = node_budget
+    stats.stop = stop
+    for depth in range(2, max_depth + 1):
+        if score in (AI_WIN_SCORE, HUMAN_WIN_SCORE):
+            break  # The result is already forced
+        nodes_before = stats.nodes
+        depth_scores = {}
+        try:
+            column, score = minimax(position, depth, maximizingPlayer, use_alpha_beta=use_alpha_beta, stats=stats,
+                                    tt=tt, ordering=ordering, use_pvs=use_pvs, use_threats=use_threats,
+                                    root_scores=depth_scores, multi_pv=multi_pv)
+        except SearchTimeout:
+            break
+        move_scores = depth_scores
+        depth_reached = depth
+        nodes_per_depth.append(stats.nodes - nodes_before)
+        if progress is not None:
+            progress(depth, column, score)
+
+    # Effective branching factor: how many times more nodes each extra ply cost
+    branching_factors = [nodes_per_depth[d] / nodes_per_depth[d - 1] for d in range(1, len(nodes_per_depth))]
+
+    return column, score, {
+        "depth": depth_reached,
+        "nodes": stats.nodes,
+        "allocations": stats.allocations,
+        "nodes_per_depth": nodes_per_depth,
+        "branching_factors": branching_factors,
+        "elapsed": time.time() - start_time,
+        "book": False,
+        "pruned": stats.pruned,
+        "stats": stats.as_dict(),
+        "move_scores": {col: score for col, (score, _) in sorted(move_scores.items())},
+        "move_bounds": {col: BOUND_NAMES[bound] for col, (_, bound) in sorted(move_scores.items())},
+        "pv": principal_variation(position, tt, maximizingPlayer, depth_reached),
+    }
+
+
+# Every worker process keeps one table for the subtrees of one parallel_minimax
+# call. Entries of an earlier call, from other roots and depths, would change
+# the scores, so the table is cleared when the search id changes.
+_worker_tt = None
+_worker_search_id = None
+_search_ids = itertools.count()
+
+
+def _search_subtree(board, depth, maximizingPlayer, use_alpha_beta, search_id):
+    global _worker_tt, _worker_search_id
+    if _worker_tt is None:
+        _worker_tt = TranspositionTable()
+    if search_id != _worker_search_id:
+        _worker_tt.clear()
+        _worker_search_id = search_id
+    _worker_tt.new_search()
+    ordering = MoveOrdering() if use_alpha_beta else None
+    stats = SearchStats()
+    score = minimax(board, depth, maximizingPlayer, use_alpha_beta=use_alpha_beta, stats=stats, tt=_worker_tt,
+                    ordering=ordering)[1]
+    return score, stats.nodes
+
+
+def _split_tree(position, depth, maximizingPlayer, split_depth, tasks):
+    # Expands the top split_depth plies and queues every position below them
+    # as a task. Returns either a task index or (maximizingPlayer, [(col, subtree)...]).
+    if split_depth == 0 or depth == 0 or position.is_win(AI_PLAYER) or position.is_win(HUMAN_PLAYER) \
+            or not position.valid_moves():
+        tasks.append((position.to_array(), depth, maximizingPlayer))
+        return len(tasks) - 1
+    children = []
+    for col in position.valid_moves():
+        position.play(col, AI_PLAYER if maximizingPlayer else HUMAN_PLAYER)
+        children.append((col, _split_tree(position, depth - 1, not maximizingPlayer, split_depth - 1, tasks)))
+        position.undo()
+    return maximizingPlayer, children
+
+
+def _combine(subtree, scores):
+    # Backs the exact task scores up the expanded plies, keeping the first of
+    # equal moves in column order like the serial search does
+    if not isinstance(subtree, tuple):
+        return None, scores[subtree]
+    maximizingPlayer, children = subtree
+    column, value = None, -math.inf if maximizingPlayer else math.inf
+    for col, child in children:
+        score = _combine(child, scores)[1]
+        if score > value if maximizingPlayer else score < value:
+            column, value = col, score
+    return column, value
+
+
+def parallel_minimax(board, depth, maximizingPlayer, use_alpha_beta=False, workers=None, split_depth=1,
+                     executor=None):
+    """Spreads the subtrees below the first split_depth plies over worker processes.
+
+    Every subtree is searched with a full window, so its score is exact and
+    the result is the same column and score as a serial
+    ``minimax(board, depth, maximizingPlayer)`` call. Searches that add move
+    ordering or iterative deepening can break ties between equally scored
+    columns differently. split_depth=2 makes up to 49 tasks instead of 7, which
+    keeps more than seven workers busy at the price of less pruning per task.
+    Pass an executor to reuse a pool across moves.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    position = Position.from_array(board)
+    tasks = []
+    tree = _split_tree(position, depth, maximizingPlayer, split_depth, tasks)
+    search_id = next(_search_ids)
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(_search_subtree, task_board, task_depth, task_max, use_alpha_beta, search_id)
+                   for task_board, task_depth, task_max in tasks]
+        results = [future.result() for future in futures]
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    column, score = _combine(tree, [score for score, _ in results])
+    return column, score, {"tasks": len(tasks), "nodes": sum(nodes for _, nodes in results)}
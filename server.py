@@ -0,0 +1,496 @@
+"""Headless game server: the engine over a local socket, without pygame.
+
+Clients speak JSON, either one object per line over a plain TCP or Unix
+socket, or over HTTP (POST /move, /new, /play, /close and GET /metrics):
+
+    python server.py --port 7474 --workers 8
+    echo '{"moves": "4453", "algorithm": "alphabeta", "depth": 6}' | nc localhost 7474
+    curl -d '{"moves": "4453", "algorithm": "mcts", "iterations": 5000}' localhost:7474/move
+
+A request names its op (default "move"), and either a position as the
+columns played (1-7) from the empty board, first player first, or a
+session made with {"op": "new"}. "move" answers the best column for the
+side to move with algorithm (alphabeta, minimax, mcts or perfect), depth,
+time and iterations; with a session the answer is also played unless
+"play" is false. {"op": "play", "session": ..., "column": 4} plays a
+column for the client. Every reply echoes the request "id", so pipelined
+line requests may be answered out of order.
+
+Searches run on a bounded process pool. Once --max-pending searches are
+waiting the server answers "busy" (HTTP 503) at once instead of queueing
+without end, and every request gives up after its deadline. The search
+itself never runs past the deadline, time spent waiting for a worker
+included, or longer than --max-time, a search that nobody waits for any
+more is dropped before it starts, and one whose deadline passed in the
+queue is skipped, so requests that gave up do not keep the pool busy. Answers are
+cached by position and settings, a position and its mirror image sharing
+one entry, and identical searches in flight are only run once. {"op": "metrics"} returns counters, the queue depth and
+latency percentiles. With --record every finished session game is appended
+to a game record file (see game_records.py).
+"""
+import argparse
+import asyncio
+import collections
+import json
+import math
+import multiprocessing
+import os
+import secrets
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from bitboard import COLUMN_COUNT, ROW_COUNT, Position, mirror_moves
+from evaluation import AI_PLAYER
+from game_records import GameWriter
+from mcts import MCTS, mcts_move
+from opening_book import open_book
+from search import iterative_deepening
+from solver import Solver, perfect_move
+from transposition import TranspositionTable
+
+ALGORITHMS = ("alphabeta", "minimax", "mcts", "perfect")
+DEFAULT_SETTINGS = {"algorithm": "alphabeta", "depth": 6, "time": None, "iterations": 2000}
+MAX_DEPTH = ROW_COUNT * COLUMN_COUNT
+MAX_ITERATIONS = 1000000
+# Seconds a request may wait for its search when it does not say
+DEFAULT_DEADLINE = 30.0
+# Seconds the perfect solver gets when the request gives no time
+PERFECT_TIME = 1.0
+# Seconds of the deadline a search leaves to send its answer back
+ANSWER_TIME = 0.05
+# Requests a single line connection may have in flight before reading stops
+CONNECTION_IN_FLIGHT = 64
+LATENCY_SAMPLES = 4096
+
+
+class RequestError(Exception):
+    pass
+
+
+# Every worker process keeps its own tables between the searches it runs
+_worker_tt = None
+_worker_solver = None
+
+
+def _search(moves, algorithm, depth, time_budget, iterations, expires):
+    # expires is the time.time() of the request deadline, and None is returned once it passed
+    global _worker_tt, _worker_solver
+    time_budget = min(time_budget, expires - ANSWER_TIME - time.time())
+    if time_budget <= 0:
+        return None
+    position = Position.from_moves(moves)
+    piece = 1 if len(moves) % 2 == 0 else 2
+    # The engines take the bitboard position as it is, workers never need NumPy
+    if algorithm == "mcts":
+        column, score, info = mcts_move(position, piece, MCTS(), iterations=iterations, time_budget=time_budget)
+    elif algorithm == "perfect":
+        if _worker_solver is None:
+            _worker_solver = Solver()
+        column, score, info = perfect_move(position, piece, time_budget=time_budget, solver=_worker_solver,
+                                           max_depth=depth, use_alpha_beta=True)
+    else:
+        if _worker_tt is None:
+            _worker_tt = TranspositionTable()
+        column, score, info = iterative_deepening(position, piece == AI_PLAYER, max_depth=depth,
+                                                  time_budget=time_budget, use_alpha_beta=algorithm == "alphabeta",
+                                                  tt=_worker_tt, book=open_book())
+    score = float(score)
+    return {
+        "column": int(column) + 1,
+        # Minimax scores are from the second player's side, like in the game
+        "score": score if math.isfinite(score) else None,
+        "depth": info["depth"],
+        "nodes": info["nodes"],
+        "elapsed": round(info["elapsed"], 6),
+        "book": info["book"],
+        "solved": info.get("solved"),
+    }
+
+
+def _game_state(moves):
+    # Raises RequestError for moves that are illegal or come after the end
+    try:
+        position = Position.from_moves(moves)
+    except ValueError as error:
+        raise RequestError(str(error))
+    winner = None
+    for piece in (1, 2):
+        if position.is_win(piece):
+            winner = piece
+    if winner is not None:
+        # Only the last move may complete four
+        position.undo()
+        if position.is_win(winner):
+            raise RequestError("Moves continue after the game is over")
+    return {"moves": moves, "winner": winner, "over": winner is not None or len(moves) == MAX_DEPTH,
+            "to_move": 1 if len(moves) % 2 == 0 else 2}
+
+
+def _oriented(result, mirrored, **fields):
+    # A search result of the canonical image for the position asked about
+    result = dict(result, **fields)
+    if mirrored:
+        result["column"] = COLUMN_COUNT + 1 - result["column"]
+    return result
+
+
+def _int_setting(request, name, low, high):
+    value = request.get(name, DEFAULT_SETTINGS[name])
+    if not isinstance(value, int) or isinstance(value, bool) or not low <= value <= high:
+        raise RequestError(f"{name} must be an integer from {low} to {high}")
+    return value
+
+
+class GameServer:
+    def __init__(self, workers=None, max_pending=256, cache_size=100000, max_sessions=10000, max_time=10.0,
+                 recorder=None):
+        # Forked workers would keep copies of the client sockets open at the time
+        # and the client would never see its connection close
+        context = multiprocessing.get_context("forkserver" if os.name == "posix" else "spawn")
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        self.max_pending = max_pending
+        self.cache_size = cache_size
+        self.max_sessions = max_sessions
+        self.max_time = max_time
+        self.recorder = recorder  # a GameWriter for finished session games, or None
+        self.cache = collections.OrderedDict()
+        self.in_flight = {}  # cache key -> asyncio future of the running search
+        self.waiters = {}  # in flight future -> requests waiting for it
+        self.sessions = collections.OrderedDict()
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.counters = collections.Counter()
+        self.connections = 0
+        self.started = time.time()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.recorder is not None:
+            self.recorder.close()
+
+    # Sessions
+
+    def _session(self, request):
+        session_id = request.get("session")
+        if session_id not in self.sessions:
+            raise RequestError(f"Unknown session: {session_id}")
+        self.sessions.move_to_end(session_id)
+        return session_id
+
+    def _new_session(self, request):
+        moves = str(request.get("moves", ""))
+        state = _game_state(moves)
+        session_id = secrets.token_hex(8)
+        self.sessions[session_id] = moves
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+        return dict(state, session=session_id)
+
+    def _play(self, session_id, column):
+        moves = self.sessions[session_id]
+        if _game_state(moves)["over"]:
+            raise RequestError("The game is over")
+        state = _game_state(moves + str(column))
+        self.sessions[session_id] = state["moves"]
+        if state["over"] and self.recorder is not None:
+            self.recorder.append(state["moves"])
+            self.counters["games_recorded"] += 1
+        return state
+
+    # Searches
+
+    def _settings(self, request, deadline):
+        # The time budget of the search is bounded by the deadline and max_time, even
+        # when the request only gives a depth, so no search outlives its request
+        algorithm = request.get("algorithm", DEFAULT_SETTINGS["algorithm"])
+        if algorithm not in ALGORITHMS:
+            raise RequestError(f"algorithm must be one of {', '.join(ALGORITHMS)}")
+        depth = _int_setting(request, "depth", 1, MAX_DEPTH)
+        iterations = _int_setting(request, "iterations", 1, MAX_ITERATIONS)
+        time_budget = request.get("time")
+        if time_budget is not None:
+            if not isinstance(time_budget, (int, float)) or not 0 < time_budget <= self.max_time:
+                raise RequestError(f"time must be a number of seconds up to {self.max_time}")
+            time_budget = float(time_budget)
+        else:
+            time_budget = PERFECT_TIME if algorithm == "perfect" else self.max_time
+        time_budget = min(time_budget, float(deadline))
+        if algorithm != "mcts":
+            iterations = None
+        return algorithm, depth, time_budget, iterations
+
+    def _cache_result(self, key, future):
+        self.in_flight.pop(key, None)
+        self.waiters.pop(future, None)
+        if future.cancelled() or future.exception() is not None or future.result() is None:
+            return
+        self.cache[key] = future.result()
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def search(self, moves, settings, expires):
+        # expires is the time.time() the request gives up at
+        # Position keys leave out the side to move, which follows from the move count.
+        # Mirror images share the entry of the canonical one, searched and cached
+        # as that image, and the column is mirrored back for the other.
+        position_key, mirrored = Position.from_moves(moves).canonical_key()
+        key = (position_key, len(moves) % 2) + settings
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.counters["cache_hits"] += 1
+            return _oriented(self.cache[key], mirrored, cached=True)
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.counters["shared_searches"] += 1
+        else:
+            if len(self.in_flight) >= self.max_pending:
+                self.counters["rejected"] += 1
+                raise RequestError("busy")
+            self.counters["searches"] += 1
+            future = asyncio.wrap_future(self.executor.submit(_search, mirror_moves(moves) if mirrored else moves,
+                                                              *settings, expires))
+            future.add_done_callback(lambda done: self._cache_result(key, done))
+            self.in_flight[key] = future
+            self.waiters[future] = 0
+        self.waiters[future] += 1
+        try:
+            # Shielded so a timeout leaves the search running for the cache and other waiters
+            result = await asyncio.wait_for(asyncio.shield(future), max(0.0, expires - time.time()))
+        except asyncio.TimeoutError:
+            result = None
+        finally:
+            if future in self.waiters:
+                self.waiters[future] -= 1
+                if not self.waiters[future]:
+                    # The last waiter gave up. A search still queued is dropped,
+                    # a running one ends at its deadline.
+                    future.cancel()
+        if result is None:
+            # Also a shared search that ran out of the deadline of the request that started it
+            self.counters["timeouts"] += 1
+            raise RequestError("timeout")
+        return _oriented(result, mirrored, cached=False)
+
+    # Requests
+
+    async def handle(self, request):
+        """Answers one decoded request with a dict that has "ok" and the request "id"."""
+        start_time = time.perf_counter()
+        self.counters["requests"] += 1
+        request_id = request.get("id") if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict):
+                raise RequestError("A request must be a JSON object")
+            reply = await self._dispatch(request)
+            reply["ok"] = True
+        except RequestError as error:
+            if str(error) not in ("busy", "timeout"):
+                self.counters["errors"] += 1
+            reply = {"ok": False, "error": str(error)}
+        except Exception as error:
+            self.counters["errors"] += 1
+            reply = {"ok": False, "error": f"{type(error).__name__}: {error}"}
+        reply["id"] = request_id
+        self.latencies.append(time.perf_counter() - start_time)
+        return reply
+
+    async def _dispatch(self, request):
+        op = request.get("op", "move")
+        if op == "metrics":
+            return self.metrics()
+        if op == "new":
+            return self._new_session(request)
+        if op == "close":
+            self.sessions.pop(self._session(request), None)
+            return {}
+        if op == "play":
+            column = request.get("column")
+            if not isinstance(column, int) or isinstance(column, bool):
+                raise RequestError("column must be an integer from 1 to 7")
+            session_id = self._session(request)
+            return dict(self._play(session_id, column), session=session_id)
+        if op != "move":
+            raise RequestError(f"Unknown op: {op}")
+
+        session_id = None
+        if "session" in request:
+            session_id = self._session(request)
+            moves = self.sessions[session_id]
+        else:
+            moves = str(request.get("moves", ""))
+        if _game_state(moves)["over"]:
+            raise RequestError("The game is over")
+        deadline = request.get("deadline", DEFAULT_DEADLINE)
+        if not isinstance(deadline, (int, float)) or isinstance(deadline, bool) or deadline <= 0:
+            raise RequestError("deadline must be a positive number of seconds")
+        expires = time.time() + deadline
+        settings = self._settings(request, deadline)
+        reply = await self.search(moves, settings, expires)
+        if session_id is not None:
+            reply["session"] = session_id
+            # The session may have been closed or played on while the search ran
+            if request.get("play", True) and self.sessions.get(session_id) == moves:
+                reply.update(self._play(session_id, reply["column"]))
+        return reply
+
+    def metrics(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(fraction):
+            if not latencies:
+                return None
+            return round(1000 * latencies[min(len(latencies) - 1, int(fraction * len(latencies)))], 3)
+
+        uptime = time.time() - self.started
+        return dict(
+            self.counters,
+            queue_depth=len(self.in_flight),
+            max_pending=self.max_pending,
+            cache_entries=len(self.cache),
+            sessions=len(self.sessions),
+            connections=self.connections,
+            uptime=round(uptime, 3),
+            requests_per_second=round(self.counters["requests"] / uptime, 1) if uptime else 0.0,
+            latency_ms={"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99)},
+        )
+
+    # Connections
+
+    async def serve_connection(self, reader, writer):
+        self.connections += 1
+        try:
+            first = await reader.readline()
+            if first.startswith((b"GET ", b"POST ")):
+                await self._serve_http(first, reader, writer)
+            elif first:
+                await self._serve_lines(first, reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _answer_line(self, line, writer, slots):
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                self.counters["errors"] += 1
+                reply = {"ok": False, "error": "Invalid JSON", "id": None}
+            else:
+                reply = await self.handle(request)
+            writer.write(json.dumps(reply).encode() + b"\n")
+            await writer.drain()
+        finally:
+            slots.release()
+
+    async def _serve_lines(self, line, reader, writer):
+        # Requests on one connection run concurrently, and reading waits
+        # while CONNECTION_IN_FLIGHT of them are unanswered
+        slots = asyncio.Semaphore(CONNECTION_IN_FLIGHT)
+        tasks = set()
+        while line:
+            if line.strip():
+                await slots.acquire()
+                task = asyncio.create_task(self._answer_line(line, writer, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            line = await reader.readline()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _serve_http(self, request_line, reader, writer):
+        while request_line:
+            method, path, version = (request_line.decode("latin-1").split() + ["", "", ""])[:3]
+            headers = {}
+            while True:
+                header = await reader.readline()
+                if header in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = header.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            try:
+                length = int(headers.get("content-length", 0) or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                # Without the length the next request can't be found, so the connection ends here
+                await self._write_http(writer, 400, {"ok": False, "error": "Invalid Content-Length", "id": None},
+                                       False)
+                return
+            body = await reader.readexactly(length)
+
+            status = 200
+            if method == "GET" and path == "/metrics":
+                reply = await self.handle({"op": "metrics"})
+            elif method == "POST" and path.strip("/") in ("move", "new", "play", "close", "metrics"):
+                try:
+                    request = json.loads(body or b"{}")
+                except ValueError:
+                    request = None
+                if isinstance(request, dict):
+                    request.setdefault("op", path.strip("/"))
+                    reply = await self.handle(request)
+                    if not reply["ok"]:
+                        status = {"busy": 503, "timeout": 504}.get(reply["error"], 400)
+                else:
+                    status, reply = 400, {"ok": False, "error": "Invalid JSON", "id": None}
+            else:
+                status, reply = 404, {"ok": False, "error": f"No route for {method} {path}", "id": None}
+
+            keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+            await self._write_http(writer, status, reply, keep_alive)
+            if not keep_alive:
+                return
+            request_line = await reader.readline()
+
+    async def _write_http(self, writer, status, reply, keep_alive):
+        payload = json.dumps(reply).encode()
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 503: "Service Unavailable",
+                  504: "Gateway Timeout"}[status]
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(payload)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}"
+                     f"\r\n\r\n".encode() + payload)
+        await writer.drain()
+
+
+async def serve(args):
+    recorder = GameWriter(args.record) if args.record else None
+    server = GameServer(args.workers, args.max_pending, args.cache_size, args.max_sessions, args.max_time, recorder)
+    try:
+        if args.unix:
+            listener = await asyncio.start_unix_server(server.serve_connection, path=args.unix)
+            where = args.unix
+        else:
+            listener = await asyncio.start_server(server.serve_connection, args.host, args.port)
+            where = ", ".join(str(sock.getsockname()) for sock in listener.sockets)
+        print(f"Serving on {where}", file=sys.stderr)
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the Connect 4 engine over a local socket.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7474)
+    parser.add_argument("--unix", default=None, help="listen on this Unix socket path instead of TCP")
+    parser.add_argument("--workers", type=int, default=None, help="search processes (default: CPU count)")
+    parser.add_argument("--max-pending", type=int, default=256, help="searches queued before answering busy")
+    parser.add_argument("--cache-size", type=int, default=100000, help="answers kept for repeated positions")
+    parser.add_argument("--max-sessions", type=int, default=10000)
+    parser.add_argument("--max-time", type=float, default=10.0,
+                        help="largest time budget a request may ask for, and the budget of searches that give none")
+    parser.add_argument("--record", default=None, help="append finished session games to this game record file")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""Exact solver: the game-theoretic result of a position under perfect play.
+
+A negamax search with null windows, an upper-bound transposition table and
+bitboard threat detection. It only generates moves that do not hand the
+opponent an immediate win, and it plays forced blocks without branching.
+Scores follow the usual convention for solvers: 0 is a draw, a positive
+score means the side to move wins, and the larger the score the sooner.
+The side that wins with its k-th to last stone of the 21 it has scores k.
+A weak solve only tells win, draw or loss apart and is much faster.
+In the opening a position and its mirror image share a table entry, and
+symmetric positions only search the moves on one side of the board.
+
+    solver = Solver()
+    solver.analyze(position, HUMAN_PLAYER)  # result, distance and best move
+"""
+import time
+
+from bitboard import COLUMN_COUNT, COLUMN_MASKS, ROW_COUNT, Position, mirror, mirror_moves, playable_cells, \
+    winning_cells
+from move_ordering import CENTER_ORDER
+from search import MIRROR_PLIES, SearchTimeout, iterative_deepening
+
+CELLS = ROW_COUNT * COLUMN_COUNT
+MIN_SCORE = -(CELLS // 2) + 3
+SOLVE_SHARE = 0.5  # Part of perfect_move's budget the solve may use before the fallback search
+
+
+def plies_to_end(score, moves_played):
+    # How many moves, both sides counted, until the game ends with that score
+    if score == 0:
+        return CELLS - moves_played
+    if score < 0:
+        return 1 + plies_to_end(-score, moves_played + 1)
+    # The winner's last stone is move number CELLS + 1 - 2 * score, shifted
+    # by one so it falls on the winner's turn
+    last_move = CELLS + 1 - 2 * score + (moves_played % 2)
+    return last_move - moves_played
+
+
+def result_name(score):
+    return "win" if score > 0 else "loss" if score < 0 else "draw"
+
+
+class Solver:
+    def __init__(self, table_size=(1 << 20) + 7):
+        # An odd table size spreads the bitboard keys over the slots. Empty
+        # slots hold None, the empty board's key is 0
+        self.table_size = table_size
+        self.keys = [None] * table_size
+        self.values = [0] * table_size
+        self.nodes = 0
+        self.deadline = None
+        self.stop = None  # a threading.Event that ends the solve when set
+
+    def clear(self):
+        self.keys = [None] * self.table_size
+        self.nodes = 0
+
+    def _negamax(self, current, mask, moves, alpha, beta):
+        self.nodes += 1
+        if not self.nodes & 4095:
+            if self.deadline is not None and time.time() > self.deadline:
+                raise SearchTimeout()
+            if self.stop is not None and self.stop.is_set():
+                raise SearchTimeout()
+
+        possible = playable_cells(mask)
+        opponent_wins = winning_cells(current ^ mask, mask)
+        forced = possible & opponent_wins
+        if forced:
+            if forced & (forced - 1):
+                return -((CELLS - moves) // 2)  # Two threats, one can't block both
+            possible = forced
+        # Never play right under a cell the opponent wins on
+        possible &= ~(opponent_wins >> 1)
+        if not possible:
+            return -((CELLS - moves) // 2)
+        if moves >= CELLS - 2:
+            return 0
+
+        low = -((CELLS - 2 - moves) // 2)
+        if alpha < low:
+            alpha = low
+            if alpha >= beta:
+                return alpha
+        high = (CELLS - 1 - moves) // 2
+        key = current + mask
+        symmetric = False
+        if moves < MIRROR_PLIES:
+            mirror_key = mirror(key)
+            symmetric = mirror_key == key
+            if mirror_key < key:
+                key = mirror_key
+        slot = key % self.table_size
+        if self.keys[slot] == key:
+            high = self.values[slot] + MIN_SCORE - 1
+        if beta > high:
+            beta = high
+            if alpha >= beta:
+                return beta
+
+        # Moves that create the most new threats first, center first among equals
+        candidates = []
+        for col in CENTER_ORDER:
+            move = possible & COLUMN_MASKS[col]
+            if move and not (symmetric and 2 * col > COLUMN_COUNT - 1):
+                candidates.append((winning_cells(current | move, mask).bit_count(), move))
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+        opponent = current ^ mask
+        for _, move in candidates:
+            score = -self._negamax(opponent, mask | move, moves + 1, -beta, -alpha)
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+
+        self.keys[slot] = key
+        self.values[slot] = alpha - MIN_SCORE + 1
+        return alpha
+
+    def solve_bitboards(self, current, mask, weak=False):
+        moves = mask.bit_count()
+        if winning_cells(current, mask) & playable_cells(mask):
+            return (CELLS + 1 - moves) // 2
+        low, high = -((CELLS - moves) // 2), (CELLS + 1 - moves) // 2
+        if weak:
+            low, high = -1, 1
+        # Narrow the score down with null-window searches, trying scores
+        # near zero first because they are the cheapest to refute
+        while low < high:
+            med = low + (high - low) // 2
+            if med <= 0 and int(low / 2) < med:
+                med = int(low / 2)
+            elif med >= 0 and high // 2 > med:
+                med = high // 2
+            r = self._negamax(current, mask, moves, med, med + 1)
+            if r <= med:
+                high = r
+            else:
+                low = r
+        return low
+
+    def solve(self, position, piece, weak=False, time_budget=None):
+        # Score of position with piece to move
+        self.deadline = None if time_budget is None else time.time() + time_budget
+        try:
+            return self.solve_bitboards(position.bitboards[piece], position.mask(), weak)
+        finally:
+            self.deadline = None
+
+    def best_move(self, position, piece, weak=False, time_budget=None):
+        # (column, score) for piece, one solve plus a null-window test per move
+        self.deadline = None if time_budget is None else time.time() + time_budget
+        current, mask = position.bitboards[piece], position.mask()
+        moves = mask.bit_count()
+        try:
+            score = self.solve_bitboards(current, mask, weak)
+            playable = playable_cells(mask)
+            wins = winning_cells(current, mask) & playable
+            # _negamax assumes the side to move cannot win at once, so like it
+            # only block a threat when there is one and never play under one
+            opponent_wins = winning_cells(current ^ mask, mask)
+            candidates = (playable & opponent_wins) or playable
+            safe = candidates & ~(opponent_wins >> 1)
+            fallback = None
+            for col in CENTER_ORDER:
+                move = playable & COLUMN_MASKS[col]
+                if not move:
+                    continue
+                if wins & move:
+                    return col, score
+                if not move & candidates:
+                    continue
+                # A lost position still needs a move, a block when there is a threat
+                fallback = col if fallback is None else fallback
+                if not move & safe:
+                    continue
+                if moves + 1 == CELLS:
+                    return col, score
+                # Does the move keep at least the score of the position?
+                if -self._negamax(current ^ mask, mask | move, moves + 1, -score, -score + 1) >= score:
+                    return col, score
+            return fallback, score
+        finally:
+            self.deadline = None
+
+    def analyze(self, position, piece, weak=False, time_budget=None):
+        """Solves every move of piece and returns the result of the best one.
+
+        The returned dict has the exact score, "win"/"draw"/"loss", the number
+        of moves to the end of the game under perfect play (None for a weak
+        solve), the best column, the score of every column and the
+        nodes searched.
+        """
+        self.deadline = None if time_budget is None else time.time() + time_budget
+        nodes_before = self.nodes
+        current, mask = position.bitboards[piece], position.mask()
+        moves = mask.bit_count()
+        try:
+            scores = {}
+            symmetric = position.is_symmetric()
+            for col in CENTER_ORDER:
+                if not position.can_play(col):
+                    continue
+                if symmetric and 2 * col > COLUMN_COUNT - 1:
+                    # The mirror image of a column already solved
+                    scores[col] = scores[COLUMN_COUNT - 1 - col]
+                    continue
+                move = playable_cells(mask) & COLUMN_MASKS[col]
+                if winning_cells(current, mask) & move:
+                    scores[col] = (CELLS + 1 - moves) // 2
+                elif moves + 1 == CELLS:
+                    scores[col] = 0
+                else:
+                    scores[col] = -self.solve_bitboards(current ^ mask, mask | move, weak)
+        finally:
+            self.deadline = None
+
+        best_move = max(scores, key=lambda col: scores[col])
+        score = scores[best_move]
+        return {
+            "score": score,
+            "result": result_name(score),
+            "plies_to_end": None if weak else plies_to_end(score, moves),
+            "best_move": best_move,
+            "move_scores": dict(sorted(scores.items())),
+            "nodes": self.nodes - nodes_before,
+        }
+
+
+def perfect_move(board, piece, time_budget=None, solver=None, stop=None, multi_pv=False, **fallback):
+    """Column, score and info for piece to move on an array board or a Position, like iterative_deepening.
+
+    The solve gets SOLVE_SHARE of time_budget. When it does not finish in
+    that time, or the stop event is set, the move comes from
+    iterative_deepening with the fallback settings, the rest of the budget
+    and the same stop event instead, and info["solved"] is False. With
+    multi_pv every move is solved, and info["move_scores"] has the exact
+    score of each, at the price of a slower solve.
+    """
+    start_time = time.time()
+    solve_budget = None if time_budget is None else time_budget * SOLVE_SHARE
+    position = board if isinstance(board, Position) else Position.from_array(board)
+    solver = solver or Solver()
+    nodes_before = solver.nodes
+    solver.stop = stop
+    move_scores = None
+    try:
+        if multi_pv:
+            analysis = solver.analyze(position, piece, time_budget=solve_budget)
+            column, score, move_scores = analysis["best_move"], analysis["score"], analysis["move_scores"]
+        else:
+            column, score = solver.best_move(position, piece, time_budget=solve_budget)
+    except SearchTimeout:
+        remaining = None if time_budget is None else max(0.0, start_time + time_budget - time.time())
+        column, score, info = iterative_deepening(board, piece == 2, time_budget=remaining, stop=stop,
+                                                  multi_pv=multi_pv, **fallback)
+        info["solved"] = False
+        info["elapsed"] = time.time() - start_time
+        return column, score, info
+    finally:
+        solver.stop = None
+    info = {
+        "depth": plies_to_end(score, position.mask().bit_count()),
+        "nodes": solver.nodes - nodes_before,
+        "allocations": 0,
+        "nodes_per_depth": [],
+        "branching_factors": [],
+        "elapsed": time.time() - start_time,
+        "book": False,
+        "solved": True,
+        "result": result_name(score),
+    }
+    if move_scores is not None:
+        info["move_scores"] = move_scores
+    return column, score, info
+
+
+_worker_solver = None
+
+
+def _analyze_moves(args):
+    global _worker_solver
+    if _worker_solver is None:
+        _worker_solver = Solver()
+    moves, weak = args
+    position = Position.from_moves(moves)
+    piece = 1 if len(moves) % 2 == 0 else 2
+    return dict(_worker_solver.analyze(position, piece, weak), moves=moves)
+
+
+def solve_batch(move_strings, weak=False, workers=None):
+    """Analyzes many positions on a pool of worker processes.
+
+    Positions are strings of the columns played (1-7) from the empty board,
+    first player first. Returns one analyze() dict per position, in order.
+    Repeated positions and mirror images are only solved once.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    jobs, keys = {}, []
+    for moves in move_strings:
+        key, mirrored = Position.from_moves(moves).canonical_key()
+        jobs.setdefault(key, mirror_moves(moves) if mirrored else moves)
+        keys.append((key, mirrored))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = dict(zip(jobs, executor.map(_analyze_moves, [(moves, weak) for moves in jobs.values()])))
+    analyses = []
+    for moves, (key, mirrored) in zip(move_strings, keys):
+        analysis = dict(results[key], moves=moves)
+        if mirrored:
+            analysis["best_move"] = COLUMN_COUNT - 1 - analysis["best_move"]
+            analysis["move_scores"] = dict(sorted((COLUMN_COUNT - 1 - col, score)
+                                                  for col, score in analysis["move_scores"].items()))
+        analyses.append(analysis)
+    return analyses
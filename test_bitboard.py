@@ -0,0 +1,77 @@
+import random
+
+from bitboard import STANDARD, Position, mirror, mirror_moves, parse_variant
+from search import minimax
+from transposition import TranspositionTable
+
+
+def random_moves(rng, geometry, plies):
+    # A move string of a game that is not over after plies moves, or sooner when no move is left
+    position = geometry.position_class()
+    moves = ""
+    for ply in range(plies):
+        piece = 1 if ply % 2 == 0 else 2
+        col = rng.choice(position.valid_moves())
+        position.play(col, piece)
+        if position.is_win(piece):
+            position.undo()
+            break
+        moves += str(col + 1)
+    return moves
+
+
+def test_mirror_matches_the_mirrored_game():
+    rng = random.Random(0)
+    for _ in range(200):
+        moves = random_moves(rng, STANDARD, rng.randint(0, 30))
+        position, image = Position.from_moves(moves), Position.from_moves(mirror_moves(moves))
+        assert mirror(position.key()) == image.key()
+        assert mirror(mirror(position.key())) == position.key()
+        assert [mirror(bb) for bb in position.bitboards] == image.bitboards
+        mirrored = position.mirrored()
+        assert mirrored.bitboards == image.bitboards and mirrored.heights == image.heights
+        assert mirrored.moves == image.moves
+
+
+def test_canonical_key_is_shared_by_mirror_images():
+    rng = random.Random(1)
+    for _ in range(200):
+        moves = random_moves(rng, STANDARD, rng.randint(0, 20))
+        position, image = Position.from_moves(moves), Position.from_moves(mirror_moves(moves))
+        key, mirrored = position.canonical_key()
+        image_key, image_mirrored = image.canonical_key()
+        assert key == image_key == min(position.key(), image.key())
+        assert mirrored == (key != position.key())
+        if position.is_symmetric():
+            assert not mirrored and not image_mirrored
+        else:
+            assert mirrored != image_mirrored
+    assert Position.from_moves("4").is_symmetric() and not Position.from_moves("3").is_symmetric()
+
+
+def test_geometry_mirror_on_variants():
+    rng = random.Random(2)
+    for geometry in (parse_variant("7x9x5"), parse_variant("5x6"), STANDARD):
+        for _ in range(50):
+            moves = random_moves(rng, geometry, rng.randint(0, 20))
+            position = geometry.position_class.from_moves(moves)
+            image = geometry.position_class.from_moves(mirror_moves(moves, geometry.columns))
+            assert geometry.mirror(position.key()) == image.key()
+            assert position.mirrored().bitboards == image.bitboards
+
+
+def test_search_of_a_mirror_image_mirrors_the_move():
+    rng = random.Random(3)
+    for _ in range(20):
+        moves = random_moves(rng, STANDARD, rng.randint(1, 11))
+        maximizingPlayer = len(moves) % 2 == 1
+        tt = TranspositionTable()
+        column, score = minimax(Position.from_moves(moves).to_array(), 4, maximizingPlayer, use_alpha_beta=True,
+                                tt=tt)
+        # The image finds its root in the table the first search filled, stored under the shared key
+        hits = tt.hits
+        image_column, image_score = minimax(Position.from_moves(mirror_moves(moves)).to_array(), 4,
+                                            maximizingPlayer, use_alpha_beta=True, tt=tt)
+        assert image_score == score
+        assert image_column == (column if Position.from_moves(moves).is_symmetric() else 6 - column)
+        assert tt.hits > hits
@@ -0,0 +1,112 @@
+import random
+
+import numpy as np
+
+from bitboard import COLUMN_COUNT, ROW_COUNT, has_four
+from evaluation import AI_PLAYER, HUMAN_PLAYER, EvaluatedPosition, bitboards_to_boards, evaluate_batch, \
+    evaluate_board
+
+
+# The evaluation of the original game script, the reference the tables must match
+def original_evaluate_window(window, piece):
+    score = 0
+    opp_piece = HUMAN_PLAYER if piece == AI_PLAYER else AI_PLAYER
+
+    if window.count(piece) == 4:
+        score += 100
+    elif window.count(piece) == 3 and window.count(0) == 1:
+        score += 5
+    elif window.count(piece) == 2 and window.count(0) == 2:
+        score += 2
+
+    if window.count(opp_piece) == 3 and window.count(0) == 1:
+        score -= 4
+
+    return score
+
+
+def original_score_position(board, piece):
+    score = 0
+
+    center_array = [int(i) for i in list(board[:, COLUMN_COUNT // 2])]
+    score += center_array.count(piece) * 3
+
+    for r in range(ROW_COUNT):
+        row_array = [int(i) for i in list(board[r, :])]
+        for c in range(COLUMN_COUNT - 3):
+            score += original_evaluate_window(row_array[c:c + 4], piece)
+
+    for c in range(COLUMN_COUNT):
+        col_array = [int(i) for i in list(board[:, c])]
+        for r in range(ROW_COUNT - 3):
+            score += original_evaluate_window(col_array[r:r + 4], piece)
+
+    for r in range(ROW_COUNT - 3):
+        for c in range(COLUMN_COUNT - 3):
+            score += original_evaluate_window([board[r + i][c + i] for i in range(4)], piece)
+
+    for r in range(ROW_COUNT - 3):
+        for c in range(COLUMN_COUNT - 3):
+            score += original_evaluate_window([board[r + 3 - i][c + i] for i in range(4)], piece)
+
+    return score
+
+
+def random_games(count, seed=0):
+    # Every position of random games played to the end, wins included
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        position = EvaluatedPosition()
+        moves = []
+        for ply in range(ROW_COUNT * COLUMN_COUNT):
+            piece = HUMAN_PLAYER if ply % 2 == 0 else AI_PLAYER
+            col = rng.choice(position.valid_moves())
+            position.play(col, piece)
+            moves.append((col, piece))
+            if position.is_win(piece):
+                break
+        games.append(moves)
+    return games
+
+
+def test_evaluate_board_matches_original():
+    for moves in random_games(40):
+        position = EvaluatedPosition()
+        for col, piece in moves:
+            position.play(col, piece)
+            board = position.to_array()
+            for side in (HUMAN_PLAYER, AI_PLAYER):
+                assert evaluate_board(board, side) == original_score_position(board, side)
+
+
+def test_incremental_score_matches_original():
+    for moves in random_games(40, seed=1):
+        position = EvaluatedPosition()
+        scores = [position.score]
+        for col, piece in moves:
+            position.play(col, piece)
+            assert position.score == original_score_position(position.to_array(), AI_PLAYER)
+            scores.append(position.score)
+        # Undoing every move gives back the same scores in reverse
+        for score in reversed(scores[:-1]):
+            position.undo()
+            assert position.score == score
+        assert position.codes == EvaluatedPosition().codes
+
+
+def test_evaluate_batch_matches_original():
+    boards, bitboards = [], []
+    for moves in random_games(20, seed=2):
+        position = EvaluatedPosition()
+        for col, piece in moves:
+            position.play(col, piece)
+            boards.append(position.to_array())
+            bitboards.append(position.bitboards[1:])
+    boards = np.array(boards)
+    assert (bitboards_to_boards(bitboards) == boards).all()
+    for piece in (HUMAN_PLAYER, AI_PLAYER):
+        human_wins, ai_wins, scores = evaluate_batch(boards, piece, chunk_size=64)
+        assert scores.tolist() == [original_score_position(board, piece) for board in boards]
+        assert human_wins.tolist() == [has_four(bb[0]) for bb in bitboards]
+        assert ai_wins.tolist() == [has_four(bb[1]) for bb in bitboards]
@@ -0,0 +1,69 @@
+import pytest
+
+from bitboard import Position
+from game_records import DRAW, FIRST_WINS, SECOND_WINS, UNFINISHED, GameIndex, GameWriter, build_index, \
+    default_index_path, game_result, games_through, move_stats, pack_record, read_games
+
+GAMES = ["4444", "1212121", "4453", "4435", "5344", "12121272", "4"]
+
+
+def write_games(path, games):
+    with GameWriter(str(path)) as writer:
+        return [writer.append(moves) for moves in games]
+
+
+def test_records_read_back_in_order(tmp_path):
+    path = tmp_path / "games.c4g"
+    assert write_games(path, GAMES[:4]) == [UNFINISHED, FIRST_WINS, UNFINISHED, UNFINISHED]
+    # Appending to an existing file keeps what is there
+    write_games(path, GAMES[4:])
+    records = list(read_games(str(path)))
+    assert [record.moves for record in records] == GAMES
+    assert [record.result for record in records][5] == SECOND_WINS
+
+
+def test_full_game_packs_into_23_bytes():
+    assert len(pack_record("4" * 42, DRAW)) == 23
+    assert len(pack_record("4" * 41, UNFINISHED)) == 23
+
+
+def test_game_result_rejects_bad_games():
+    assert game_result("") == UNFINISHED
+    for moves in ("8", "4444444", "12121213"):
+        with pytest.raises(ValueError):
+            game_result(moves)
+
+
+def test_partial_record_is_skipped(tmp_path):
+    path = tmp_path / "games.c4g"
+    write_games(path, GAMES)
+    with open(path, "ab") as f:
+        f.write(pack_record("44534453", UNFINISHED)[:3])
+    assert [record.moves for record in read_games(str(path))] == GAMES
+
+
+def test_other_files_are_refused(tmp_path):
+    path = tmp_path / "games.c4g"
+    path.write_bytes(b"nope1234")
+    with pytest.raises(ValueError):
+        list(read_games(str(path)))
+    with pytest.raises(ValueError):
+        GameWriter(str(path))
+
+
+def test_index_finds_transpositions_and_mirror_images(tmp_path):
+    path = tmp_path / "games.c4g"
+    write_games(path, GAMES)
+    build_index(str(path), plies=4)
+    index = GameIndex(default_index_path(str(path)))
+    # 4453, its mirror image 4435 and the transposition 5344
+    assert sorted(record.moves for record in games_through(str(path), index, "4453")) == ["4435", "4453", "5344"]
+    assert len(index.lookup(Position())) == len(GAMES)
+    # Past the indexed plies nothing is found
+    assert len(index.lookup(Position.from_moves("12121"))) == 0
+    # Games through the mirror image count with the mirrored column
+    assert move_stats(str(path), index, "44") == {
+        3: {"games": 1, "first": 0, "second": 0, "draw": 0, "unfinished": 1},
+        4: {"games": 1, "first": 0, "second": 0, "draw": 0, "unfinished": 1},
+        5: {"games": 1, "first": 0, "second": 0, "draw": 0, "unfinished": 1},
+    }
@@ -0,0 +1,74 @@
+from bitboard import Position
+from mcts import MCTS, mcts_move
+
+
+def reachable(engine):
+    # Nodes of the tree below the root, the root included
+    count, stack = 0, [engine.root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(engine.children[node].values())
+    return count
+
+
+def set_moves(engine, moves):
+    position = Position.from_moves(moves)
+    piece = 1 if len(moves) % 2 == 0 else 2
+    engine.set_position(position.bitboards[piece], position.mask())
+
+
+def test_tree_is_reused_two_moves_down():
+    engine = MCTS(seed=0)
+    set_moves(engine, "44")
+    engine.search(3000)
+    allocated = len(engine.moves)
+    before = len(engine)
+    own, reply = engine.best_move()[0], 3
+    set_moves(engine, "44" + str(own + 1) + str(reply + 1))
+    assert engine.visits[engine.root] > 0
+    # Everything outside the kept subtree is back on the free list
+    assert len(engine) == reachable(engine) < before
+    engine.search(3000)
+    assert len(engine.moves) < allocated + 3000
+
+
+def test_unrelated_position_gets_a_new_tree():
+    engine = MCTS(seed=0)
+    set_moves(engine, "44")
+    engine.search(1000)
+    set_moves(engine, "1122")
+    assert engine.visits[engine.root] == 0
+    assert len(engine) == 1
+
+
+def test_tree_stops_growing_at_max_nodes():
+    engine = MCTS(max_nodes=300, seed=0)
+    set_moves(engine, "")
+    assert engine.search(2000) == 2000
+    assert len(engine) <= 300
+    own = engine.best_move()[0]
+    set_moves(engine, str(own + 1) + "4")
+    engine.search(2000)
+    # Recycled nodes are used again before the lists grow
+    assert len(engine) <= 300 and len(engine.moves) <= 300
+
+
+def test_mirrored_reply_keeps_the_tree():
+    # The empty board only expands the left half, a move on the right is found as its mirror image
+    engine = MCTS(seed=0)
+    set_moves(engine, "")
+    engine.search(2000)
+    set_moves(engine, "6")
+    assert engine.mirrored and engine.visits[engine.root] > 0
+    mirror_image = Position.from_moves("2")
+    assert engine.root_position == (mirror_image.bitboards[2], mirror_image.mask())
+    # Columns come back as columns of the position searched
+    engine.search(50)
+    assert set(engine.root_stats()) == {6 - col for col in engine.children[engine.root]}
+
+
+def test_mcts_move_takes_a_win():
+    column, score, info = mcts_move(Position.from_moves("1212627").to_array(), 2, iterations=500)
+    assert column == 1 and score > 90
+    assert info["reused_visits"] == 0
@@ -0,0 +1,90 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bitboard import Position
+from mcts import MCTS, mcts_move
+from ponder import Ponderer, likely_replies, ponder_tree
+from search import iterative_deepening
+from transposition import TranspositionTable
+
+
+def test_likely_replies_start_with_the_expected_move():
+    board = Position.from_moves("4453").to_array()
+    assert likely_replies(board, 1) == [3, 2, 4, 1, 5, 0, 6]
+    tt = TranspositionTable()
+    column = iterative_deepening(board, False, max_depth=4, use_alpha_beta=True, tt=tt)[0]
+    replies = likely_replies(board, 1, tt, False)
+    assert replies[0] == column and sorted(replies) == list(range(7))
+
+
+def test_finished_searches_answer_at_once():
+    searched = []
+
+    def search(board, stop):
+        searched.append(board)
+        return int(board.sum()), 0, {}
+
+    ponderer = Ponderer(search)
+    board = Position.from_moves("44").to_array()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        ponderer.submit(executor, board, 1, [3, 2, 4]).result()
+    assert len(searched) == 3 and board.sum() == 3
+    # Each search got the board after its reply
+    assert [int((child[:, col] == 1).sum()) for child, col in zip(searched, [3, 2, 4])] == [2, 1, 1]
+    ponderer.play(2)
+    assert ponderer.hits == 1 and ponderer.result(2) == (4, 0, {})
+
+
+def test_a_miss_stops_the_running_search():
+    started = threading.Event()
+
+    def search(board, stop):
+        started.set()
+        stop.wait(5)
+        return 0, 0, {}
+
+    ponderer = Ponderer(search)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = ponderer.submit(executor, Position().to_array(), 1, [3, 2])
+        started.wait(5)
+        start_time = time.time()
+        ponderer.play(6)
+        future.result()
+    assert time.time() - start_time < 1
+    assert ponderer.misses == 1 and ponderer.result(3) is None and ponderer.result(2) is None
+
+
+def test_the_reply_played_keeps_searching():
+    started, release = threading.Event(), threading.Event()
+    stops = []
+
+    def search(board, stop):
+        stops.append(stop)
+        started.set()
+        release.wait(5)
+        return 1, 0, {}
+
+    ponderer = Ponderer(search)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = ponderer.submit(executor, Position().to_array(), 1, [3, 2])
+        started.wait(5)
+        ponderer.play(3)
+        assert not stops[0].is_set()
+        release.set()
+        future.result()
+    # The next reply is never started once the opponent has played
+    assert len(stops) == 1
+    assert ponderer.hits == 1 and ponderer.result(3) == (1, 0, {})
+
+
+def test_ponder_tree_is_reused_by_the_next_move():
+    engine = MCTS(max_nodes=2000, seed=0)
+    position = Position.from_moves("44")
+    stop = threading.Event()
+    # Stops by itself once the tree is full
+    assert ponder_tree(engine, position.bitboards[1], position.mask(), stop, chunk=256) > 0
+    assert len(engine) >= engine.max_nodes
+    position.play(2, 1)
+    _, _, info = mcts_move(position, 2, engine, iterations=500, count_reused=True)
+    assert info["reused_visits"] > 0
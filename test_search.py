@@ -0,0 +1,98 @@
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from bitboard import Position
+from search import AI_WIN_SCORE, SearchStats, minimax, parallel_minimax
+from transposition import EXACT
+
+
+def test_parallel_minimax_matches_serial_on_a_reused_pool():
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        for moves in ["", "44444322", "4453", "", "44444322"]:
+            board = Position.from_moves(moves).to_array()
+            for maximizingPlayer in (True, False):
+                for depth, split_depth in ((3, 2), (2, 1)):
+                    expected = minimax(board, depth, maximizingPlayer)[:2]
+                    column, score, _ = parallel_minimax(board, depth, maximizingPlayer, split_depth=split_depth,
+                                                        executor=executor)
+                    assert (column, score) == expected, (moves, maximizingPlayer, depth)
+                    # Pruning inside the tasks keeps their scores exact
+                    score = parallel_minimax(board, depth, maximizingPlayer, use_alpha_beta=True,
+                                             split_depth=split_depth, executor=executor)[1]
+                    assert score == expected[1], (moves, maximizingPlayer, depth)
+
+
+def test_parallel_minimax_splits_below_finished_games():
+    # A game won inside the split plies is a task of its own instead of a subtree
+    board = Position.from_moves("112233").to_array()
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        column, score, info = parallel_minimax(board, 3, False, split_depth=2, executor=executor)
+        assert (column, score) == minimax(board, 3, False)[:2]
+        assert info["tasks"] == 7 * 7 - 6
+        _, _, info = parallel_minimax(Position().to_array(), 2, False, split_depth=2, executor=executor)
+        assert info["tasks"] == 49
+
+
+def test_threats_take_an_immediate_win():
+    stats = SearchStats()
+    board = Position.from_moves("1212627").to_array()
+    assert minimax(board, 4, True, use_alpha_beta=True, stats=stats, use_threats=True) == (1, AI_WIN_SCORE)
+    assert stats.nodes == 1 and stats.pruned["immediate_win"] == 6
+
+
+def test_threats_force_the_block():
+    stats = SearchStats()
+    board = Position.from_moves("121262").to_array()
+    root_scores = {}
+    column, score = minimax(board, 3, False, use_alpha_beta=True, stats=stats, use_threats=True,
+                            root_scores=root_scores)
+    assert column == 1 and score != AI_WIN_SCORE
+    assert stats.pruned["forced_block"] == 6
+    # Every other column lets the AI win at once
+    assert all(root_scores[col] == (AI_WIN_SCORE, EXACT) for col in range(7) if col != 1)
+    assert minimax(board, 3, False, use_alpha_beta=True)[0] == 1
+
+
+def test_threats_see_a_double_threat():
+    stats = SearchStats()
+    board = Position.from_moves("727364").to_array()
+    assert minimax(board, 3, False, use_alpha_beta=True, stats=stats, use_threats=True)[1] == AI_WIN_SCORE
+    assert stats.pruned["double_threat"] == 6
+    assert minimax(board, 3, False)[1] == AI_WIN_SCORE
+
+
+def test_threats_never_hand_over_a_win():
+    # Whenever some move leaves the opponent no win on the next move, the chosen one does
+    rng = random.Random(3)
+    checked = 0
+    for _ in range(200):
+        position = Position()
+        for ply in range(rng.randint(6, 30)):
+            col = rng.choice(position.valid_moves())
+            position.play(col, 1 if ply % 2 == 0 else 2)
+            if position.is_win(1) or position.is_win(2):
+                position.undo()
+                break
+        piece = 1 if len(position.moves) % 2 == 0 else 2
+
+        def hands_over_win(col):
+            position.play(col, piece)
+            loses = not position.is_win(piece) and any(
+                position.can_play(reply) and wins_with(position, reply, 3 - piece) for reply in range(7))
+            position.undo()
+            return loses
+
+        safe = [col for col in position.valid_moves() if not hands_over_win(col)]
+        # One ply is too shallow to see the reply, the shortcuts alone avoid it
+        column = minimax(position.to_array(), 1, piece == 2, use_alpha_beta=True, use_threats=True)[0]
+        if safe:
+            assert column in safe
+            checked += 1
+    assert checked > 100
+
+
+def wins_with(position, col, piece):
+    position.play(col, piece)
+    won = position.is_win(piece)
+    position.undo()
+    return won
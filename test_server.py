@@ -0,0 +1,156 @@
+import asyncio
+import json
+import time
+
+from server import GameServer
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_abandoned_requests_leave_the_pool():
+    async def scenario():
+        server = GameServer(workers=1)
+        try:
+            # Starts the worker process
+            assert (await server.handle({"moves": "4453", "depth": 2}))["ok"]
+            busy = asyncio.create_task(server.handle({"moves": "", "algorithm": "minimax", "depth": 42, "time": 1.0}))
+            await asyncio.sleep(0.1)
+            # Queued behind the busy worker, they give up long before it is free
+            abandoned = await asyncio.gather(*[
+                server.handle({"moves": "4" * (i % 6) + "1", "algorithm": "minimax", "depth": 42, "time": 1.0,
+                               "deadline": 0.2}) for i in range(6)])
+            assert [reply["error"] for reply in abandoned] == ["timeout"] * 6
+            assert (await busy)["ok"]
+            # Without the abandoned searches in the way this one is answered at once
+            start_time = time.time()
+            reply = await server.handle({"moves": "44", "depth": 2, "deadline": 1.0})
+            assert reply["ok"] and time.time() - start_time < 0.5
+            assert server.metrics()["queue_depth"] == 0
+        finally:
+            server.close()
+
+    run(scenario())
+
+
+def test_search_budget_counts_the_wait():
+    async def scenario():
+        server = GameServer(workers=1)
+        try:
+            assert (await server.handle({"moves": "4453", "depth": 2}))["ok"]
+            busy = asyncio.create_task(server.handle({"moves": "", "algorithm": "minimax", "depth": 42, "time": 0.5}))
+            await asyncio.sleep(0.1)
+            # Waits about 0.4 s for the worker, which leaves it 0.6 s of its deadline
+            start_time = time.time()
+            reply = await server.handle({"moves": "1", "algorithm": "minimax", "depth": 42, "deadline": 1.0})
+            await busy
+            assert reply["ok"] and reply["elapsed"] < 0.8
+            assert time.time() - start_time < 1.0
+        finally:
+            server.close()
+
+    run(scenario())
+
+
+def http_exchange(server, request):
+    async def scenario():
+        listener = await asyncio.start_server(server.serve_connection, "127.0.0.1", 0)
+        async with listener:
+            reader, writer = await asyncio.open_connection(*listener.sockets[0].getsockname()[:2])
+            writer.write(request)
+            await writer.drain()
+            reply = await asyncio.wait_for(reader.read(), 10)
+            writer.close()
+            return reply
+
+    return run(scenario())
+
+
+def test_http_rejects_bad_content_length():
+    server = GameServer(workers=1)
+    try:
+        for length in (b"abc", b"-5"):
+            reply = http_exchange(server, b"POST /move HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n{}")
+            assert reply.startswith(b"HTTP/1.1 400 ")
+            assert b"Invalid Content-Length" in reply
+    finally:
+        server.close()
+
+
+def test_http_connection_closes_after_the_first_search():
+    # The first search starts the workers while the connection is open
+    server = GameServer(workers=1)
+    try:
+        body = b'{"moves": "4453", "depth": 2}'
+        reply = http_exchange(server, b"POST /move HTTP/1.1\r\nContent-Length: %d\r\nConnection: close\r\n\r\n"
+                              % len(body) + body)
+        assert reply.startswith(b"HTTP/1.1 200 ")
+        assert json.loads(reply.partition(b"\r\n\r\n")[2])["column"] == 6
+    finally:
+        server.close()
+
+
+def test_cache_shares_mirror_images():
+    async def scenario():
+        server = GameServer(workers=1)
+        try:
+            first = await server.handle({"moves": "4453", "depth": 4})
+            again = await server.handle({"moves": "4453", "depth": 4})
+            mirrored = await server.handle({"moves": "4435", "depth": 4})
+            assert not first["cached"] and again["cached"] and mirrored["cached"]
+            assert again["column"] == first["column"]
+            assert mirrored["column"] == 8 - first["column"]
+            # Other settings are another entry
+            assert not (await server.handle({"moves": "4453", "depth": 3}))["cached"]
+            assert server.counters["searches"] == 2 and server.counters["cache_hits"] == 2
+        finally:
+            server.close()
+
+    run(scenario())
+
+
+def test_identical_searches_run_once():
+    async def scenario():
+        server = GameServer(workers=2)
+        try:
+            request = {"moves": "44", "algorithm": "minimax", "depth": 42, "time": 0.3}
+            replies = await asyncio.gather(*[server.handle(dict(request, id=i)) for i in range(4)])
+            assert [reply["id"] for reply in replies] == [0, 1, 2, 3]
+            assert len({reply["column"] for reply in replies}) == 1
+            assert server.counters["searches"] == 1 and server.counters["shared_searches"] == 3
+        finally:
+            server.close()
+
+    run(scenario())
+
+
+def test_full_queue_answers_busy():
+    async def scenario():
+        server = GameServer(workers=1, max_pending=1)
+        try:
+            busy = asyncio.create_task(server.handle({"moves": "", "algorithm": "minimax", "depth": 42, "time": 0.3}))
+            await asyncio.sleep(0)
+            assert (await server.handle({"moves": "4", "depth": 2}))["error"] == "busy"
+            assert (await busy)["ok"]
+            assert server.metrics()["rejected"] == 1
+        finally:
+            server.close()
+
+    run(scenario())
+
+
+def test_session_plays_the_answer():
+    async def scenario():
+        server = GameServer(workers=1)
+        try:
+            session = (await server.handle({"op": "new", "moves": "44"}))["session"]
+            played = await server.handle({"op": "play", "session": session, "column": 5})
+            assert played["moves"] == "445" and played["to_move"] == 2
+            reply = await server.handle({"session": session, "depth": 2})
+            assert reply["moves"] == "445" + str(reply["column"])
+            assert (await server.handle({"op": "play", "session": session, "column": 9}))["ok"] is False
+        finally:
+            server.close()
+
+    run(scenario())
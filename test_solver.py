@@ -0,0 +1,95 @@
+import random
+import time
+
+from bitboard import Position, mirror_moves
+from search import SearchTimeout
+from solver import Solver, perfect_move, result_name, solve_batch
+
+
+def random_positions(count, min_plies, max_plies, seed=0):
+    # Move strings of random games that are not over yet
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        position = Position()
+        moves = ""
+        for ply in range(rng.randint(min_plies, max_plies)):
+            piece = 1 if ply % 2 == 0 else 2
+            col = rng.choice(position.valid_moves())
+            position.play(col, piece)
+            if position.is_win(piece):
+                break
+            moves += str(col + 1)
+        else:
+            positions.append(moves)
+    return positions
+
+
+def test_best_move_blocks_threat():
+    moves = "237225532765736674575532"
+    column, score = Solver().best_move(Position.from_moves(moves), 1)
+    assert (column, score) == (5, 2)
+
+
+def test_best_move_agrees_with_analyze():
+    solver = Solver()
+    for moves in random_positions(60, 20, 32):
+        position = Position.from_moves(moves)
+        piece = 1 if len(moves) % 2 == 0 else 2
+        analysis = solver.analyze(position, piece)
+        column, score = solver.best_move(position, piece)
+        assert score == analysis["score"], moves
+        assert analysis["move_scores"][column] == score, moves
+
+
+def test_perfect_move_fallback_keeps_budget():
+    # Too early to solve in the budget, the fallback search only gets what is left
+    start_time = time.time()
+    _, _, info = perfect_move(Position.from_moves("4"), 2, time_budget=0.5, max_depth=42, use_alpha_beta=True)
+    elapsed = time.time() - start_time
+    assert not info["solved"]
+    assert elapsed < 0.9
+    assert info["elapsed"] >= 0.5
+
+
+def test_empty_board_is_not_a_table_hit():
+    # The empty board's key is 0, which must not match an empty table slot
+    _, _, info = perfect_move(Position(), 1, time_budget=0.2, max_depth=2, use_alpha_beta=True)
+    assert not info["solved"] or info["result"] == "win"
+
+
+def test_analyze_shallow_positions_matches_fresh_solves():
+    solver = Solver()
+    # Far too deep to solve, but it goes through the empty board's table slot first
+    try:
+        solver.solve(Position(), 1, time_budget=0.2)
+    except SearchTimeout:
+        pass
+    for moves in ["67164634", "6561545361", "3333514574", "442562613665", "432145374157"]:
+        position = Position.from_moves(moves)
+        piece = 1 if len(moves) % 2 == 0 else 2
+        analysis = solver.analyze(position, piece)
+        for col, score in analysis["move_scores"].items():
+            child = Position.from_moves(moves + str(col + 1))
+            if not child.is_win(piece):
+                assert -Solver().solve(child, 3 - piece) == score, (moves, col)
+        assert analysis["result"] == result_name(analysis["score"])
+
+
+def test_perfect_move_fallback_reaches_depth():
+    # An open position: the solve gives up early enough for the fallback to finish its depth
+    _, _, info = perfect_move(Position.from_moves("4453"), 1, time_budget=3.0, multi_pv=True, max_depth=6,
+                              use_alpha_beta=True)
+    assert not info["solved"]
+    assert info["depth"] == 6
+
+
+def test_solve_batch_mirrors_results_back():
+    positions = ["67164634", mirror_moves("67164634"), "6561545361", "67164634"]
+    analyses = solve_batch(positions, workers=2)
+    assert [analysis["moves"] for analysis in analyses] == positions
+    for moves, analysis in zip(positions, analyses):
+        expected = Solver().analyze(Position.from_moves(moves), 1 if len(moves) % 2 == 0 else 2)
+        assert analysis["move_scores"] == expected["move_scores"], moves
+        assert analysis["score"] == expected["score"]
+        assert expected["move_scores"][analysis["best_move"]] == expected["score"]
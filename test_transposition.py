@@ -0,0 +1,78 @@
+import random
+
+from bitboard import Position
+from search import minimax
+from transposition import ENTRY_BYTES, EXACT, LOWER, UPPER, TranspositionTable
+
+
+def test_depth_policy_keeps_the_deeper_entry():
+    tt = TranspositionTable(max_bytes=ENTRY_BYTES * 8, policy="depth")
+    key, other = 3, 3 + tt.buckets  # the same bucket
+    tt.store(key, 5, 10, EXACT, 2)
+    tt.store(other, 2, 20, LOWER, 4)
+    assert tt.probe(key) == (5, 10, EXACT, 2)
+    assert tt.probe(other) is None
+    # The same position is always stored again
+    tt.store(key, 1, 30, UPPER, 3)
+    assert tt.probe(key) == (1, 30, UPPER, 3)
+
+
+def test_depth_policy_replaces_entries_of_older_searches():
+    tt = TranspositionTable(max_bytes=ENTRY_BYTES * 8, policy="depth")
+    key, other = 3, 3 + tt.buckets
+    tt.store(key, 5, 10, EXACT, 2)
+    tt.new_search()
+    tt.store(other, 2, 20, LOWER, 4)
+    assert tt.probe(other) == (2, 20, LOWER, 4)
+    assert tt.probe(key) is None
+    assert tt.replacements == 1
+
+
+def test_two_tier_keeps_both_entries():
+    tt = TranspositionTable(max_bytes=ENTRY_BYTES * 16)
+    key, other, third = 3, 3 + tt.buckets, 3 + 2 * tt.buckets
+    tt.store(key, 5, 10, EXACT, 2)
+    tt.store(other, 2, 20, LOWER, 4)
+    assert tt.probe(key) == (5, 10, EXACT, 2)
+    assert tt.probe(other) == (2, 20, LOWER, 4)
+    # The always-replace slot takes the next shallow entry, the deep one stays
+    tt.store(third, 1, 30, UPPER, 0)
+    assert tt.probe(key) == (5, 10, EXACT, 2)
+    assert tt.probe(other) is None
+    assert tt.probe(third) == (1, 30, UPPER, 0)
+
+
+def test_table_size_is_bounded():
+    tt = TranspositionTable(max_bytes=ENTRY_BYTES * 64)
+    for key in range(10000):
+        tt.store(key, key % 7, key, EXACT, None)
+    assert len(tt.keys) <= 64
+    tt.clear()
+    assert tt.usage() == 0.0 and tt.probe(9999) is None
+
+
+def test_for_depth_is_capped():
+    assert len(TranspositionTable.for_depth(2).keys) < len(TranspositionTable.for_depth(6).keys)
+    assert len(TranspositionTable.for_depth(42).keys) == len(TranspositionTable().keys)
+
+
+def test_bounds_keep_alpha_beta_scores_exact():
+    # A table far too small for the search keeps replacing entries, the
+    # scores must still be the plain minimax ones
+    rng = random.Random(0)
+    for _ in range(12):
+        position = Position()
+        for ply in range(rng.randint(0, 14)):
+            col = rng.choice(position.valid_moves())
+            position.play(col, 1 if ply % 2 == 0 else 2)
+            if position.is_win(1) or position.is_win(2):
+                position.undo()
+                break
+        board = position.to_array()
+        maximizingPlayer = len(position.moves) % 2 == 1
+        expected = {depth: minimax(board, depth, maximizingPlayer)[1] for depth in (2, 4)}
+        for tt in (TranspositionTable(max_bytes=ENTRY_BYTES * 64), TranspositionTable()):
+            # Later searches start from the entries of the earlier ones
+            for depth in (2, 4, 4):
+                tt.new_search()
+                assert minimax(board, depth, maximizingPlayer, use_alpha_beta=True, tt=tt)[1] == expected[depth]
@@ -0,0 +1,187 @@
+"""Headless AI-vs-AI matches, without pygame.
+
+Plays a number of games between two engine configurations on a pool of
+worker processes and streams one JSON line per finished game:
+
+    python tournament.py --games 200 --engine-a depth=6,alpha_beta=1 \\
+        --engine-b depth=4,alpha_beta=1,time=0.5 --workers 8 > results.jsonl
+
+An engine is a comma separated list of settings: depth (maximum depth),
+alpha_beta (0/1), pvs (0/1), threats (0/1, threat pruning), time (seconds
+per move), nodes (node budget per move), book (path of an opening book, see
+opening_book.py) and mcts (rollouts per move, switches the engine to Monte
+Carlo tree search under the same time budget). The engines swap colors
+every game, and every game starts from a random opening of --opening-plies
+moves seeded from --seed, so runs can be repeated exactly. --record also
+appends every game to a game record file (see game_records.py), and
+--variant plays on another board, such as 9x10x5 for a 9 row, 10 column
+board and five in a row.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from bitboard import STANDARD, geometry, parse_variant
+from evaluation import AI_PLAYER, HUMAN_PLAYER
+from game_records import GameWriter, move_string
+from mcts import MCTS, mcts_move
+from opening_book import open_book
+from search import iterative_deepening
+from transposition import TranspositionTable
+
+DEFAULT_ENGINE = {"depth": 4, "use_alpha_beta": True, "use_pvs": False, "use_threats": False, "time_budget": None,
+                  "node_budget": None, "book": None, "mcts_iterations": None}
+
+_ENGINE_KEYS = {
+    "depth": ("depth", int),
+    "alpha_beta": ("use_alpha_beta", lambda value: bool(int(value))),
+    "pvs": ("use_pvs", lambda value: bool(int(value))),
+    "threats": ("use_threats", lambda value: bool(int(value))),
+    "time": ("time_budget", float),
+    "nodes": ("node_budget", int),
+    "book": ("book", str),
+    "mcts": ("mcts_iterations", int),
+}
+
+
+def parse_engine(spec):
+    engine = dict(DEFAULT_ENGINE)
+    for item in filter(None, spec.split(",")):
+        name, _, value = item.partition("=")
+        if name not in _ENGINE_KEYS:
+            raise ValueError(f"Unknown engine setting: {name}")
+        key, convert = _ENGINE_KEYS[name]
+        engine[key] = convert(value)
+    return engine
+
+
+def random_opening(plies, rng, geometry=STANDARD):
+    position = geometry.position_class()
+    moves = []
+    for ply in range(plies):
+        piece = HUMAN_PLAYER if ply % 2 == 0 else AI_PLAYER
+        # Openings that already decide the game are no use for comparing engines
+        candidates = [col for col in position.valid_moves() if not _wins(position, col, piece)]
+        if not candidates:
+            break
+        col = rng.choice(candidates)
+        position.play(col, piece)
+        moves.append(col)
+    return moves
+
+
+def _wins(position, col, piece):
+    position.play(col, piece)
+    won = position.is_win(piece)
+    position.undo()
+    return won
+
+
+def play_game(first, second, opening=(), geometry=STANDARD):
+    # first plays HUMAN_PLAYER pieces and moves first, like turn 0 in main
+    engines = {HUMAN_PLAYER: first, AI_PLAYER: second}
+    tables = {piece: TranspositionTable() for piece in engines}
+    books = {piece: open_book(engine["book"]) if engine["book"] else None for piece, engine in engines.items()}
+    trees = {piece: MCTS(geometry=geometry) for piece in engines}
+    board = np.zeros((geometry.rows, geometry.columns))
+    position = geometry.position_class()
+    moves, move_times, nodes, depths = [], [], [], []
+    winner = None
+
+    for ply in range(geometry.cells):
+        piece = HUMAN_PLAYER if ply % 2 == 0 else AI_PLAYER
+        if ply < len(opening):
+            col = opening[ply]
+        else:
+            engine = engines[piece]
+            start_time = time.time()
+            if engine["mcts_iterations"]:
+                col, _, info = mcts_move(position, piece, trees[piece], iterations=engine["mcts_iterations"],
+                                         time_budget=engine["time_budget"])
+            else:
+                col, _, info = iterative_deepening(board, piece == AI_PLAYER, max_depth=engine["depth"],
+                                                   time_budget=engine["time_budget"],
+                                                   node_budget=engine["node_budget"],
+                                                   use_alpha_beta=engine["use_alpha_beta"], tt=tables[piece],
+                                                   use_pvs=engine["use_pvs"], book=books[piece],
+                                                   use_threats=engine["use_threats"], geometry=geometry)
+            col = int(col)
+            move_times.append(round(time.time() - start_time, 6))
+            nodes.append(info["nodes"])
+            depths.append(info["depth"])
+        board[position.next_open_row(col)][col] = piece
+        position.play(col, piece)
+        moves.append(col)
+        if position.is_win(piece):
+            winner = piece
+            break
+
+    return {"moves": moves, "winner": winner, "move_times": move_times, "nodes": nodes, "depths": depths}
+
+
+def _play_match_game(index, engine_a, engine_b, opening, shape):
+    a_first = index % 2 == 0
+    first, second = (engine_a, engine_b) if a_first else (engine_b, engine_a)
+    record = play_game(first, second, opening, geometry(*shape))
+    names = {HUMAN_PLAYER: "A" if a_first else "B", AI_PLAYER: "B" if a_first else "A"}
+    record["winner"] = names.get(record["winner"], "draw")
+    return dict({"game": index, "first": names[HUMAN_PLAYER], "opening": list(opening)}, **record)
+
+
+def run_tournament(engine_a, engine_b, games, workers=None, opening_plies=4, seed=0, geometry=STANDARD):
+    # Yields one record per game as soon as it finishes, not in game order
+    rng = random.Random(seed)
+    openings = []
+    for index in range(games):
+        # Both color assignments of a pair start from the same opening
+        openings.append(openings[-1] if index % 2 else random_opening(opening_plies, rng, geometry))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_play_match_game, index, engine_a, engine_b, openings[index], geometry.shape())
+                   for index in range(games)]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play headless games between two AI engines.")
+    parser.add_argument("--games", type=int, default=10)
+    parser.add_argument("--engine-a", default="", help="for example depth=6,alpha_beta=1,time=0.5")
+    parser.add_argument("--engine-b", default="")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--opening-plies", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="-", help="JSON Lines file (default: stdout)")
+    parser.add_argument("--record", default=None, help="also append the games to this game record file")
+    parser.add_argument("--variant", default="6x7x4", help="ROWSxCOLUMNSxCONNECT, for example 9x10x5")
+    args = parser.parse_args(argv)
+
+    engine_a, engine_b = parse_engine(args.engine_a), parse_engine(args.engine_b)
+    board_geometry = parse_variant(args.variant)
+    if args.record and board_geometry != STANDARD:
+        parser.error("game records only hold games on the standard board")
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    recorder = GameWriter(args.record) if args.record else None
+    results = {"A": 0, "B": 0, "draw": 0}
+    try:
+        for record in run_tournament(engine_a, engine_b, args.games, args.workers, args.opening_plies, args.seed,
+                                     board_geometry):
+            results[record["winner"]] += 1
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            if recorder is not None:
+                recorder.append(move_string(record["moves"]))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if recorder is not None:
+            recorder.close()
+    print(f"A {results['A']} - B {results['B']} - draws {results['draw']}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
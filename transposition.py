@@ -0,0 +1,104 @@
+"""Transposition table for the minimax search.
+
+Entries are keyed by the bitboard key of a position (``Position.key``) and
+the side to move, which is exact, so a stored key doubles as the collision
+check. The table has a fixed number of slots worked out from a memory cap
+and never grows past it.
+"""
+
+# Bound types
+EXACT = 0
+LOWER = 1  # the search failed high, the real score is at least this
+UPPER = 2  # the search failed low, the real score is at most this
+
+# Rough size of one entry: a slot in each of the parallel lists plus the key
+# and score objects they point to
+ENTRY_BYTES = 96
+DEFAULT_BYTES = 16 * 1024 * 1024
+
+POLICIES = ("depth", "two-tier")
+
+
+class TranspositionTable:
+    """Fixed-size table with depth-preferred or two-tier replacement.
+
+    With ``policy="depth"`` every bucket holds one entry, which is only
+    replaced by a search at least as deep or by an entry from a newer search.
+    With ``policy="two-tier"`` every bucket holds two entries: the first slot
+    is depth-preferred and the second always takes whatever the first slot
+    refused.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_BYTES, policy="two-tier"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown replacement policy: {policy}")
+        self.policy = policy
+        self.ways = 2 if policy == "two-tier" else 1
+        self.buckets = max(1, max_bytes // (ENTRY_BYTES * self.ways))
+        slots = self.buckets * self.ways
+        self.keys = [None] * slots
+        self.depths = [0] * slots
+        self.scores = [0] * slots
+        self.flags = [EXACT] * slots
+        self.moves = [None] * slots
+        self.generations = [0] * slots
+        self.generation = 0
+        self.reset_stats()
+
+    @classmethod
+    def for_depth(cls, depth, branching=7, max_bytes=DEFAULT_BYTES, policy="two-tier"):
+        # Sized for a search of depth plies, so a short search does not pay for
+        # allocating the full table. Four slots per position it can reach keep
+        # collisions as rare as in the full table.
+        positions = sum(branching ** d for d in range(depth + 1))
+        return cls(min(max_bytes, 4 * positions * ENTRY_BYTES), policy)
+
+    def reset_stats(self):
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def clear(self):
+        slots = self.buckets * self.ways
+        self.keys = [None] * slots
+        self.generation = 0
+        self.reset_stats()
+
+    def new_search(self):
+        # Entries from earlier searches stay usable but lose their claim on
+        # the depth-preferred slot
+        self.generation += 1
+
+    def probe(self, key):
+        self.probes += 1
+        slot = (key % self.buckets) * self.ways
+        for s in range(slot, slot + self.ways):
+            if self.keys[s] == key:
+                self.hits += 1
+                return self.depths[s], self.scores[s], self.flags[s], self.moves[s]
+        return None
+
+    def store(self, key, depth, score, flag, move):
+        slot = (key % self.buckets) * self.ways
+        keys = self.keys
+        if keys[slot] is not None and keys[slot] != key and depth < self.depths[slot] \
+                and self.generations[slot] == self.generation:
+            if self.ways == 1:
+                return
+            slot += 1
+        if keys[slot] is not None and keys[slot] != key:
+            self.replacements += 1
+        keys[slot] = key
+        self.depths[slot] = depth
+        self.scores[slot] = score
+        self.flags[slot] = flag
+        self.moves[slot] = move
+        self.generations[slot] = self.generation
+        self.stores += 1
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def usage(self):
+        return sum(1 for k in self.keys if k is not None) / len(self.keys)